@@ -10,9 +10,22 @@ import pandas as pd
 import sqlite3
 from datetime import datetime, timedelta
 import os
-import hashlib
-import io
+import re
+import sys
 import time
+import tempfile
+import hashlib
+import html
+import queue
+import threading
+import bisect
+import atexit
+import functools
+from collections import OrderedDict
+from contextlib import contextmanager
+import db_profiles
+import db_schema
+import report_export
 
 # === CONFIGURATION ===
 st.set_page_config(page_title="টিকেট বিতরণ", layout="centered")
@@ -21,6 +34,7 @@ MAX_TICKETS_PER_EMPLOYEE = 10
 TOTAL_TICKETS = 20000
 DEFAULT_ADMIN = {"username": "admin", "password": "admin123"}
 SESSION_TIMEOUT = timedelta(hours=2)
+DB_PROFILE = db_profiles.get_profile()     # TICKET_DB_PROFILE=wal | wal_durable | legacy
 
 # === CSS STYLING (ADVANCED & POLISHED) ===
 st.markdown("""
@@ -253,30 +267,150 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# === CONNECTION POOL ===
+# One process-wide pool shared by every session. A connection is checked out
+# by a single script thread at a time, so sqlite3's per-connection statement
+# cache and SQLite's page cache survive across reruns instead of being thrown
+# away with each connect()/close().
+POOL_SIZE = 16
+
+class ConnectionPool:
+    def __init__(self, path, profile, size=POOL_SIZE):
+        self.path = path
+        self.profile = profile
+        self._idle = queue.LifoQueue(maxsize=size)
+        with self.connection() as conn:
+            db_profiles.apply_journal_mode(conn, profile)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        db_profiles.apply_connection_pragmas(conn, self.profile)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@st.cache_resource
+def get_pool():
+    pool = ConnectionPool(DB_NAME, DB_PROFILE)
+    atexit.register(pool.close)
+    return pool
+
+def get_db():
+    return get_pool().connection()
+
+# === EMPLOYEE DIRECTORY ===
+# The roster is loaded once per process into a sorted id array with a
+# parallel array of slotted records, and shared by every session. A
+# dedicated connection watches PRAGMA data_version (free when nothing has
+# been committed) and, when it moves, counters.roster_version tells whether
+# it was the employees table that changed or just another sale.
+# Prefix search bisects the sorted id array and a sorted (name, position)
+# array, so type-ahead suggestions never touch the database.
+SUGGESTION_LIMIT = 5
+
+class Employee:
+    __slots__ = ("employee_id", "employee_name")
+
+    def __init__(self, employee_id, employee_name):
+        self.employee_id = employee_id
+        self.employee_name = employee_name
+
+class EmployeeDirectory:
+    def __init__(self, path, profile):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        db_profiles.apply_connection_pragmas(self._conn, profile)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._roster_version = None
+        self.ids = []
+        self.records = []
+        self._pos = {}
+        self._names = []
+
+    def _refresh(self):
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        row = self._conn.execute("SELECT roster_version FROM counters WHERE id = 1").fetchone()
+        roster_version = row[0] if row else None
+        if roster_version == self._roster_version and self.ids:
+            return
+        rows = self._conn.execute("SELECT employee_id, employee_name FROM employees ORDER BY employee_id").fetchall()
+        self.records = [Employee(eid, name) for eid, name in rows]
+        self.ids = [r.employee_id for r in self.records]
+        self._pos = {eid: i for i, eid in enumerate(self.ids)}
+        self._names = sorted(((r.employee_name or "").casefold(), i) for i, r in enumerate(self.records))
+        self._roster_version = roster_version
+
+    def get(self, emp_id):
+        with self._lock:
+            self._refresh()
+            i = self._pos.get(emp_id)
+            return self.records[i] if i is not None else None
+
+    def search(self, prefix, limit=SUGGESTION_LIMIT):
+        prefix = prefix.strip()
+        if not prefix:
+            return []
+        with self._lock:
+            self._refresh()
+            found = []
+            i = bisect.bisect_left(self.ids, prefix)
+            while i < len(self.ids) and len(found) < limit and self.ids[i].startswith(prefix):
+                found.append(i)
+                i += 1
+            key = prefix.casefold()
+            j = bisect.bisect_left(self._names, (key,))
+            while j < len(self._names) and len(found) < limit and self._names[j][0].startswith(key):
+                if self._names[j][1] not in found:
+                    found.append(self._names[j][1])
+                j += 1
+            return [self.records[i] for i in found]
+
+    def close(self):
+        self._conn.close()
+
+@st.cache_resource
+def get_directory():
+    directory = EmployeeDirectory(DB_NAME, DB_PROFILE)
+    atexit.register(directory.close)
+    return directory
+
 # === PASSWORD & DB FUNCTIONS ===
 def hash_password(pw):
     return hashlib.sha256(pw.encode()).hexdigest()
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS employees (employee_id TEXT PRIMARY KEY, employee_name TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS admins (username TEXT PRIMARY KEY, password TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS tickets (employee_id TEXT PRIMARY KEY, total_quantity INTEGER DEFAULT 0, first_timestamp TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS sales (
-                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 employee_id TEXT, employee_name TEXT, quantity INTEGER,
-                 seller TEXT, remark TEXT, timestamp TEXT)''')
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        db_schema.upgrade(conn)
 
 def ensure_default_admin():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    hashed = hash_password(DEFAULT_ADMIN["password"])
-    c.execute("INSERT OR IGNORE INTO admins VALUES (?, ?)", (DEFAULT_ADMIN["username"], hashed))
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        hashed = hash_password(DEFAULT_ADMIN["password"])
+        conn.execute("INSERT OR IGNORE INTO admins VALUES (?, ?)", (DEFAULT_ADMIN["username"], hashed))
+        conn.commit()
 
 def load_admins_from_excel():
     if os.path.exists("admins.xlsx"):
@@ -286,11 +420,10 @@ def load_admins_from_excel():
             df['username'] = df['username'].astype(str).str.strip()
             df['password'] = df['password'].astype(str).apply(hash_password)
             df = df[df['username'].str.lower() != 'admin']
-            conn = sqlite3.connect(DB_NAME)
-            for _, row in df.iterrows():
-                conn.execute("INSERT OR REPLACE INTO admins VALUES (?, ?)", (row['username'], row['password']))
-            conn.commit()
-            conn.close()
+            with get_db() as conn:
+                conn.executemany("INSERT OR REPLACE INTO admins VALUES (?, ?)",
+                                 df[['username', 'password']].itertuples(index=False, name=None))
+                conn.commit()
 
 def load_employees():
     if os.path.exists("employees.xlsx") and not os.path.exists("employees_loaded.xlsx"):
@@ -299,85 +432,452 @@ def load_employees():
             df = df[['Employee ID', 'Employee Name']].dropna()
             df.columns = ['employee_id', 'employee_name']
             df['employee_id'] = df['employee_id'].astype(str).str.strip()
-            conn = sqlite3.connect(DB_NAME)
-            df.to_sql('employees', conn, if_exists='replace', index=False)
-            conn.commit()
-            conn.close()
+            with get_db() as conn:
+                counts = db_schema.upsert_employees(conn, df.itertuples(index=False, name=None))
             os.rename("employees.xlsx", "employees_loaded.xlsx")
+            return counts
 
 def check_login(username, password):
     hashed = hash_password(password)
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM admins WHERE username=? AND password=?", (username, hashed))
-    result = c.fetchone()
-    conn.close()
-    return result is not None
+    with get_db() as conn:
+        row = conn.execute("SELECT 1 FROM admins WHERE username=? AND password=?", (username, hashed)).fetchone()
+    return row is not None
 
 def is_admin(username):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM admins WHERE username=?", (username,))
-    result = c.fetchone()
-    conn.close()
-    return result is not None
+    with get_db() as conn:
+        row = conn.execute("SELECT 1 FROM admins WHERE username=?", (username,)).fetchone()
+    return row is not None
+
+def suggest_employees(prefix):
+    return get_directory().search(prefix)
 
 def get_employee(emp_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT employee_name FROM employees WHERE employee_id=?", (emp_id,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else None
-
-def get_total_tickets(emp_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT total_quantity FROM tickets WHERE employee_id=?", (emp_id,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else 0
-
-def add_sale(emp_id, name, qty, seller, remark=""):
-    ts = datetime.now().strftime("%d %b %Y, %I:%M %p")
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO sales (employee_id, employee_name, quantity, seller, remark, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-              (emp_id, name, qty, seller, remark, ts))
-    current = get_total_tickets(emp_id)
-    new_total = current + qty
-    c.execute("INSERT OR REPLACE INTO tickets VALUES (?, ?, ?)", (emp_id, new_total, ts))
-    conn.commit()
-    conn.close()
+    emp = get_directory().get(emp_id)
+    return emp.employee_name if emp else None
+
+def sell_tickets(emp_id, qty, seller, remark="", allow_repeat=False):
+    # Validate-and-commit for the booth form in one write transaction.
+    # The name comes from the in-memory directory; the current total is
+    # read under BEGIN IMMEDIATE, so no other booth can sell to the same
+    # employee between the quota check and the write. Returns a dict with
+    # status ("ok", "not_found", "over_limit", "needs_remark"), name,
+    # current (before this sale), total and remaining quota.
+    name = get_employee(emp_id)
+    result = {"status": "not_found", "emp_id": emp_id, "name": name, "qty": qty,
+              "current": 0, "total": 0, "remaining": MAX_TICKETS_PER_EMPLOYEE}
+    if not name:
+        return result
+    now = datetime.now()
+    ts = now.strftime(db_schema.DISPLAY_FORMAT)
+    with get_db() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT total_quantity FROM tickets WHERE employee_id=?", (emp_id,)).fetchone()
+            current = row[0] if row else 0
+            result.update(current=current, total=current, remaining=max(0, MAX_TICKETS_PER_EMPLOYEE - current))
+            if current + qty > MAX_TICKETS_PER_EMPLOYEE:
+                result["status"] = "over_limit"
+            elif current > 0 and not allow_repeat:
+                result["status"] = "needs_remark"
+            else:
+                conn.execute("""
+                    INSERT INTO tickets (employee_id, total_quantity, first_timestamp) VALUES (?, ?, ?)
+                    ON CONFLICT(employee_id) DO UPDATE SET total_quantity = total_quantity + excluded.total_quantity
+                """, (emp_id, qty, ts))
+                conn.execute("INSERT INTO sales (employee_id, employee_name, quantity, seller, remark, timestamp, ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (emp_id, name, qty, seller, remark, ts, db_schema.to_epoch(now)))
+                conn.commit()
+                total = current + qty
+                result.update(status="ok", total=total, remaining=MAX_TICKETS_PER_EMPLOYEE - total)
+                return result
+            conn.rollback()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
 
 def get_stats():
-    conn = sqlite3.connect(DB_NAME)
-    total_emp = pd.read_sql("SELECT COUNT(*) FROM employees", conn).iloc[0,0]
-    buyers = pd.read_sql("SELECT COUNT(*) FROM tickets", conn).iloc[0,0]
-    sold = pd.read_sql("SELECT COALESCE(SUM(total_quantity),0) FROM tickets", conn).iloc[0,0]
+    with get_db() as conn:
+        total_emp, buyers, sold = conn.execute("SELECT employees, buyers, sold FROM counters WHERE id = 1").fetchone()
     remaining = max(0, TOTAL_TICKETS - sold)
-    conn.close()
     return total_emp, buyers, sold, remaining
 
+# === REPORT CACHE ===
+# Report query results shared by every admin session. Entries are keyed by
+# (query, data version, args); the version is MAX(sales.id) plus the roster
+# version, so a cached DataFrame is served until a sale or roster change
+# lands. Bounded by an approximate byte budget with LRU eviction.
+REPORT_CACHE_BYTES = 64 * 1024 * 1024
+
+def _sizeof(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return sys.getsizeof(value)
+
+class ReportCache:
+    def __init__(self, max_bytes=REPORT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, version, build):
+        with self._lock:
+            hit = self._items.get(key)
+            if hit is not None:
+                self._items.move_to_end(key)
+                return hit[0]
+        value = build()
+        size = _sizeof(value)
+        with self._lock:
+            # Anything cached under an older version can never be hit again.
+            for stale in [k for k in self._items if k[1] != version or k == key]:
+                self._bytes -= self._items.pop(stale)[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                self._bytes -= self._items.popitem(last=False)[1][1]
+        return value
+
+@st.cache_resource
+def get_report_cache():
+    return ReportCache()
+
+DATA_VERSION_SQL = "SELECT (SELECT COALESCE(MAX(id), 0) FROM sales), roster_version FROM counters WHERE id = 1"
+
+def get_data_version():
+    with get_db() as conn:
+        return conn.execute(DATA_VERSION_SQL).fetchone()
+
+def _freeze(arg):
+    return tuple(sorted(arg.items())) if isinstance(arg, dict) else arg
+
+def report_cached(fn):
+    @functools.wraps(fn)
+    def wrapper(*args):
+        version = get_data_version()
+        key = (fn.__name__, version, tuple(_freeze(a) for a in args))
+        value = get_report_cache().get_or_build(key, version, lambda: fn(*args))
+        # Shallow copy so callers can rename columns without touching the cached frame.
+        return value.copy(deep=False) if isinstance(value, pd.DataFrame) else value
+    return wrapper
+
+@report_cached
+def get_buyers():
+    with get_db() as conn:
+        return pd.read_sql("""
+            SELECT e.employee_name AS 'Employee Name', t.employee_id AS 'Employee ID', t.total_quantity AS 'Total Tickets'
+            FROM tickets t JOIN employees e ON t.employee_id = e.employee_id ORDER BY t.total_quantity DESC
+        """, conn)
+
+@report_cached
 def get_seller_stats():
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql("SELECT seller, SUM(quantity) as tickets_sold FROM sales GROUP BY seller ORDER BY tickets_sold DESC", conn)
-    conn.close()
+    with get_db() as conn:
+        df = pd.read_sql("SELECT seller, tickets as tickets_sold FROM seller_totals ORDER BY tickets_sold DESC", conn)
+    return df
+
+@report_cached
+def get_hourly_stats():
+    with get_db() as conn:
+        df = pd.read_sql("SELECT hour, seller, tickets FROM hourly_totals ORDER BY hour", conn)
+    df['hour'] = pd.to_datetime(df['hour'].map(datetime.fromtimestamp))
     return df
 
+# === SALES LOG ===
+# Keyset pagination: each page is "id < last id of the previous page", so
+# every page is an index range read no matter how deep the admin pages.
+LOG_PAGE_SIZE = 50
+LOG_COLUMNS = "ts AS 'Date & Time', employee_name AS 'Employee', employee_id AS 'Employee ID', quantity AS 'Quantity', seller AS 'Seller', remark AS 'Remark'"
+
+@report_cached
+def get_sales_page(filters, before_id=None, limit=LOG_PAGE_SIZE):
+    where, params = report_export.log_where(filters, before_id)
+    with get_db() as conn:
+        df = pd.read_sql(f"SELECT id, {LOG_COLUMNS} FROM sales{where} ORDER BY id DESC LIMIT ?", conn, params=params + [limit])
+    df['Date & Time'] = df['Date & Time'].map(db_schema.format_ts)
+    return df
+
+@report_cached
+def count_sales(filters):
+    where, params = report_export.log_where(filters)
+    with get_db() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM sales{where}", params).fetchone()[0]
+
+# === NON-BUYERS ===
+# Employees with no tickets row: an anti-join probing the tickets primary key
+# while walking the employees primary key, paged by employee_id (keyset).
+NONBUYER_SQL = """
+    SELECT e.employee_id AS 'Employee ID', e.employee_name AS 'Employee Name' FROM employees e
+    WHERE NOT EXISTS (SELECT 1 FROM tickets t WHERE t.employee_id = e.employee_id){after}
+"""
+
+@report_cached
+def get_nonbuyers_page(after_id=None, limit=LOG_PAGE_SIZE):
+    after, params = (" AND e.employee_id > ?", [after_id]) if after_id is not None else ("", [])
+    with get_db() as conn:
+        return pd.read_sql(NONBUYER_SQL.format(after=after) + " ORDER BY e.employee_id LIMIT ?", conn, params=params + [limit])
+
+@report_cached
+def count_nonbuyers():
+    with get_db() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM ({NONBUYER_SQL.format(after='')})").fetchone()[0]
+
+# === EMPLOYEE HISTORY ===
+# One employee's sales in order with a running total. idx_sales_employee keys
+# on (employee_id, rowid) and id is the rowid, so this is a single index
+# range read already in id order — no sort, no log scan.
+def get_employee_history(emp_id):
+    with get_db() as conn:
+        df = pd.read_sql("""
+            SELECT ts AS 'Date & Time', quantity AS 'Quantity', seller AS 'Seller', remark AS 'Remark',
+                   SUM(quantity) OVER (ORDER BY id) AS 'Running Total'
+            FROM sales WHERE employee_id = ? ORDER BY id
+        """, conn, params=(emp_id,))
+    df['Date & Time'] = df['Date & Time'].map(db_schema.format_ts)
+    return df
+
+def show_history(emp_id):
+    df = get_employee_history(emp_id)
+    if df.empty:
+        st.info("এই কর্মীর কোনো বিক্রয় নেই")
+        return
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    st.caption(f"{len(df)} বার কেনা · মোট {int(df['Running Total'].iloc[-1])} টি টিকেট")
+
+# === SALES SEARCH ===
+# Ranked FTS5 hits over remark, employee name and seller (sales_fts in
+# db_schema.py). Matches are wrapped in \x02/\x03 by highlight() so the
+# text can be HTML-escaped before the markers become <mark> tags.
+SEARCH_LIMIT = 50
+
+@report_cached
+def search_sales(text, limit=SEARCH_LIMIT):
+    with get_db() as conn:
+        return conn.execute("""
+            SELECT s.ts, s.employee_id, s.quantity,
+                   highlight(sales_fts, 0, char(2), char(3)),
+                   highlight(sales_fts, 1, char(2), char(3)),
+                   highlight(sales_fts, 2, char(2), char(3))
+            FROM sales_fts JOIN sales s ON s.id = sales_fts.rowid
+            WHERE sales_fts MATCH ? ORDER BY rank LIMIT ?
+        """, (db_schema.fts_query(text), limit)).fetchall()
+
+def search_available():
+    with get_db() as conn:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sales_fts'").fetchone() is not None
+
+def marked(text):
+    return html.escape(text or "").replace("\x02", "<mark>").replace("\x03", "</mark>")
+
 # === EXCEL DOWNLOAD ===
-def to_excel(df, sheet_name="Sheet1"):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name=sheet_name)
-    output.seek(0)
-    return output
+# Rows are streamed from the database straight into a write-only workbook
+# on a temp file (see report_export.py), so memory stays flat however
+# large the log grows; only the finished, compressed file is read back.
+def export_xlsx(*sheets):
+    with get_db() as conn:
+        output, stats = report_export.write_xlsx(conn, sheets)
+    with output:
+        return output.read(), stats
+
+def to_excel(*sheets):
+    return export_xlsx(*sheets)[0]
+
+# CSV / NDJSON / Parquet: same columns as the Excel sheets, built from the
+# streaming generators in report_export.py.
+def export_file(fmt, sheet):
+    with get_db() as conn:
+        return b"".join(report_export.FORMATS[fmt][3](conn, sheet))
+
+# The payload is a callable, so Streamlit builds the file only when the
+# button is actually clicked instead of on every rerun.
+def download_report(label, name, fmt, filters=None):
+    ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    sheet = report_export.sheet(name, filters)
+    if fmt == "xlsx":
+        st.download_button(label, functools.partial(to_excel, sheet), f"{name}_{ts}.xlsx", report_export.XLSX_MIME)
+    else:
+        _, ext, mime, _ = report_export.FORMATS[fmt]
+        st.download_button(label, functools.partial(export_file, fmt, sheet), f"{name}_{ts}.{ext}", mime)
+
+# === DB BACKUP ===
+# SQLite's online backup API copies one consistent snapshot, commits still
+# in the -wal file included, whatever other connections are doing. Copying
+# the .db file itself is only safe with no readers and a clean checkpoint.
+def backup_db_bytes():
+    fd, path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(DB_NAME)))
+    os.close(fd)
+    try:
+        dst = sqlite3.connect(path)
+        try:
+            with get_db() as conn:
+                conn.backup(dst)
+        finally:
+            dst.close()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+# === ALL REPORTS WORKBOOK ===
+# The three-sheet workbook is built off the request path by one background
+# thread per process. Only the report page starts the builder and calls
+# notify() (when the newest file is stale), so booth-only processes never
+# build. Builds are at least REPORT_MIN_INTERVAL_SECONDS apart, counted from
+# the end of the previous one: a large build takes tens of seconds of
+# pure-Python work and holds one read snapshot throughout. Each build writes
+# report_files/all_reports_<max sale id>_<roster version>.xlsx inside a
+# single read transaction and drops the older files. The report page serves
+# whatever is newest on disk.
+REPORTS_DIR = "report_files"
+REPORT_MIN_INTERVAL_SECONDS = 120
+ALL_REPORT_SHEETS = (("buyers", "ক্রেতা"), ("sellers", "বিক্রেতা"), ("log", "লগ"))
+REPORT_FILE_RE = re.compile(r"all_reports_(\d+)_(\d+)\.xlsx")
+
+class ReportBuilder:
+    def __init__(self, pool, directory=REPORTS_DIR):
+        self.pool = pool
+        self.directory = directory
+        self.stats = None
+        self.last_error = None
+        os.makedirs(directory, exist_ok=True)
+        self._build_lock = threading.Lock()    # background build vs. read_latest's fallback
+        self._last_built = float("-inf")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="report-builder", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def latest(self):
+        """(path, version, built_at) of the newest ready workbook, or None"""
+        ready = []
+        for name in os.listdir(self.directory):
+            m = REPORT_FILE_RE.fullmatch(name)
+            if m:
+                path = os.path.join(self.directory, name)
+                ready.append(((int(m[1]), int(m[2])), path))
+        if not ready:
+            return None
+        version, path = max(ready)
+        try:
+            return path, version, os.path.getmtime(path)
+        except FileNotFoundError:      # pruned by another process in between
+            return None
+
+    def read_latest(self, attempts=3):
+        # Read at click time; the file seen at render time may have been
+        # replaced (and pruned) since, so look again if it disappears.
+        for _ in range(attempts):
+            ready = self.latest()
+            if ready is None:
+                break
+            try:
+                with open(ready[0], "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                continue
+        # Nothing readable on disk: build one now rather than fail the download.
+        with open(self.build(), "rb") as f:
+            return f.read()
+
+    def build(self):
+        with self._build_lock:
+            return self._build()
+
+    def _build(self):
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN")       # one snapshot for the version and all three sheets
+            version = tuple(conn.execute(DATA_VERSION_SQL).fetchone())
+            path = os.path.join(self.directory, "all_reports_%d_%d.xlsx" % version)
+            if os.path.exists(path):
+                return path
+            # A unique temp name per build, so builds in other processes never
+            # write or replace the same file.
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=self.directory)
+            try:
+                with os.fdopen(fd, "wb") as out:
+                    sheets = [report_export.sheet(name, title=title) for name, title in ALL_REPORT_SHEETS]
+                    _, self.stats = report_export.write_xlsx(conn, sheets, out)
+            except BaseException:
+                os.remove(tmp)
+                raise
+        os.replace(tmp, path)
+        # Only finished workbooks are pruned; a *.tmp may be another build in progress.
+        for name in os.listdir(self.directory):
+            if name != os.path.basename(path) and REPORT_FILE_RE.fullmatch(name):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        return path
+
+    def _run(self):
+        while self._wake.wait() and not self._stop.is_set():
+            if self._stop.wait(max(0, self._last_built + REPORT_MIN_INTERVAL_SECONDS - time.monotonic())):
+                break
+            self._wake.clear()
+            try:
+                self.build()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
+            self._last_built = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+@st.cache_resource
+def get_report_builder():
+    builder = ReportBuilder(get_pool())
+    atexit.register(builder.stop)
+    return builder
+
+def format_age(seconds):
+    seconds = int(max(0, seconds))
+    if seconds < 60:
+        return f"{seconds} সেকেন্ড"
+    if seconds < 3600:
+        return f"{seconds // 60} মিনিট"
+    return f"{seconds // 3600} ঘণ্টা {seconds % 3600 // 60} মিনিট"
 
 # === APP INITIALIZATION ===
-init_db()
-ensure_default_admin()
-load_admins_from_excel()
-load_employees()
+# Streamlit reruns this script on every click, so the bootstrap is cached
+# per process. The Excel loaders are keyed on the file's (mtime, size) and
+# only run again when the file actually changes.
+def file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+@st.cache_resource
+def bootstrap_db():
+    init_db()
+    ensure_default_admin()
+
+@st.cache_resource(max_entries=1)
+def sync_admins(fingerprint):
+    load_admins_from_excel()
+
+# The file is renamed once loaded, so the ingest counts can't be recomputed
+# later; the last ones this process saw are kept for the admin page.
+@st.cache_resource
+def employee_sync_result():
+    return {}
+
+@st.cache_resource(max_entries=1)
+def sync_employees(fingerprint):
+    counts = load_employees()
+    if counts:
+        employee_sync_result().update(counts, loaded_at=datetime.now())
+
+bootstrap_db()
+sync_admins(file_fingerprint("admins.xlsx"))
+sync_employees(file_fingerprint("employees.xlsx"))
 
 # === SESSION STATE ===
 if 'logged_in' not in st.session_state: st.session_state.logged_in = False
@@ -450,11 +950,26 @@ elif page == "home" and st.session_state.logged_in:
         st.markdown("---")
         st.subheader("টিকেট বিক্রয় বুথ")
 
+        if "flash" in st.session_state:
+            st.success(st.session_state.pop("flash"))
+
         # ────── INPUT FIELDS ──────
         if 'qty_value' not in st.session_state:
             st.session_state.qty_value = 0
 
-        emp_id = st.text_input("Employee ID *", placeholder="210679", key="emp_id_input")
+        emp_id = st.text_input("Employee ID *", placeholder="210679 অথবা নাম", key="emp_id_input")
+
+        # ────── SUGGESTIONS ──────
+        def pick_employee(eid):
+            st.session_state.emp_id_input = eid
+
+        if emp_id.strip() and get_employee(emp_id) is None:
+            suggestions = suggest_employees(emp_id)
+            if suggestions:
+                st.caption("মিল পাওয়া কর্মী — বেছে নিন:")
+                for emp in suggestions:
+                    st.button(f"{emp.employee_id} — {emp.employee_name}", key=f"suggest_{emp.employee_id}",
+                              on_click=pick_employee, args=(emp.employee_id,))
         qty = st.number_input("Ticket Quantity *", min_value=0, max_value=10, step=1,
                               value=st.session_state.qty_value, key="qty_input")
 
@@ -465,31 +980,25 @@ elif page == "home" and st.session_state.logged_in:
             elif qty == 0:
                 st.error("টিকেট সংখ্যা ০ হতে পারে না। ১ বা তার বেশি লিখুন।")
             else:
-                name = get_employee(emp_id)
-                if not name:
+                result = sell_tickets(emp_id, qty, st.session_state.username)
+                if result["status"] == "not_found":
                     st.error("Employee লিস্টে পাওয়া যায়নি")
+                elif result["status"] == "over_limit":
+                    st.error(f"সর্বোচ্চ {MAX_TICKETS_PER_EMPLOYEE} টি টিকেট দেয়া যাবে। আপনি ইতমধ্যে {result['current']} টি টিকেট কিনেছেন")
+                elif result["status"] == "needs_remark":
+                    st.session_state.pending_sale = {
+                        "emp_id": emp_id, "name": result["name"], "qty": qty,
+                        "current": result["current"], "new_total": result["current"] + qty
+                    }
+                    st.rerun()
                 else:
-                    current = get_total_tickets(emp_id)
-                    new_total = current + qty
-
-                    if new_total > MAX_TICKETS_PER_EMPLOYEE:
-                        st.error(f"সর্বোচ্চ {MAX_TICKETS_PER_EMPLOYEE} টি টিকেট দেয়া যাবে। আপনি ইতমধ্যে {current} টি টিকেট কিনেছেন")
-                    elif current == 0:
-                        add_sale(emp_id, name, qty, st.session_state.username)
-                        success_placeholder = st.empty()
-                        success_placeholder.success(
-                            f"সফল: **{name}** অর্থাৎ **{emp_id}** এর জন্য {qty} টি টিকেট প্রদান করা হয়েছে। মোট: {qty}"
-                        )
-                        time.sleep(3)
-                        success_placeholder.empty()
-                        st.session_state.qty_value = 0
-                        st.rerun()
-                    else:
-                        st.session_state.pending_sale = {
-                            "emp_id": emp_id, "name": name, "qty": qty,
-                            "current": current, "new_total": new_total
-                        }
-                        st.rerun()
+                    # Shown on the next run instead of holding this thread in time.sleep().
+                    st.session_state.flash = (
+                        f"সফল: **{result['name']}** অর্থাৎ **{emp_id}** এর জন্য {qty} টি টিকেট প্রদান করা হয়েছে। "
+                        f"মোট: {result['total']} (বাকি: {result['remaining']})"
+                    )
+                    st.session_state.qty_value = 0
+                    st.rerun()
 
         # ────── REPEAT BUYER ──────
         if "pending_sale" in st.session_state:
@@ -503,6 +1012,8 @@ elif page == "home" and st.session_state.logged_in:
                 """,
                 unsafe_allow_html=True,
             )
+            with st.expander("আগের কেনাকাটা"):
+                show_history(sale["emp_id"])
             remark = st.text_input("আবার টিকেট কেনার কারন কি *", key="remark_input")
             colA, colB = st.columns(2)
             with colA:
@@ -510,11 +1021,16 @@ elif page == "home" and st.session_state.logged_in:
                     if not remark.strip():
                         st.error("একাধিক টিকেট কেনার কারণ লিখুন")
                     else:
-                        add_sale(sale["emp_id"], sale["name"], sale["qty"], st.session_state.username, remark)
-                        st.success(f"অনুমোদিত: {sale['qty']} টি টিকেট যোগ করা হয়েছে।")
+                        result = sell_tickets(sale["emp_id"], sale["qty"], st.session_state.username, remark, allow_repeat=True)
                         del st.session_state.pending_sale
-                        st.session_state.qty_value = 0
-                        st.rerun()
+                        if result["status"] == "over_limit":
+                            st.error(f"সর্বোচ্চ {MAX_TICKETS_PER_EMPLOYEE} টি টিকেট দেয়া যাবে। আপনি ইতমধ্যে {result['current']} টি টিকেট কিনেছেন")
+                        elif result["status"] == "not_found":
+                            st.error("Employee লিস্টে পাওয়া যায়নি")
+                        else:
+                            st.session_state.flash = f"অনুমোদিত: {sale['qty']} টি টিকেট যোগ করা হয়েছে। মোট: {result['total']}"
+                            st.session_state.qty_value = 0
+                            st.rerun()
             with colB:
                 if st.button("Cancel"):
                     st.info("বাতিল করা হয়েছে")
@@ -544,77 +1060,161 @@ elif page == "report":
         st.rerun()
 
     # === ALL REPORTS BUTTON ===
+    # Served from the workbook the background builder keeps up to date.
     st.markdown("### ডাউনলোড করুন")
+    builder = get_report_builder()
+    ready = builder.latest()
+    stale = ready is None or ready[1] != tuple(get_data_version())
+    if stale:
+        builder.notify()
     col_all1, col_all2 = st.columns([1, 3])
     with col_all1:
-        if st.button("**সব রিপোর্ট একসাথে (Excel)**", type="primary"):
-            conn = sqlite3.connect(DB_NAME)
-            df_buyers = pd.read_sql("""
-                SELECT e.employee_name AS 'Employee Name', t.employee_id AS 'Employee ID', t.total_quantity AS 'Total Tickets'
-                FROM tickets t JOIN employees e ON t.employee_id = e.employee_id ORDER BY t.total_quantity DESC
-            """, conn)
-            df_sellers = get_seller_stats()
-            df_sellers.columns = ['Seller', 'Tickets Sold']
-            df_log = pd.read_sql("""
-                SELECT timestamp AS 'Date & Time', employee_name AS 'Employee', employee_id AS 'Employee ID',
-                       quantity AS 'Quantity', seller AS 'Seller', remark AS 'Remark'
-                FROM sales ORDER BY id DESC
-            """, conn)
-            conn.close()
-
-            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                if not df_buyers.empty: df_buyers.to_excel(writer, sheet_name="ক্রেতা", index=False)
-                if not df_sellers.empty: df_sellers.to_excel(writer, sheet_name="বিক্রেতা", index=False)
-                if not df_log.empty: df_log.to_excel(writer, sheet_name="লগ", index=False)
-            output.seek(0)
-
+        if ready:
+            path, version, built_at = ready
             st.download_button(
-                label="Downloading all_reports_*.xlsx",
-                data=output,
-                file_name=f"all_reports_{timestamp}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                label="**সব রিপোর্ট একসাথে (Excel)**",
+                data=builder.read_latest,
+                file_name=f"all_reports_{datetime.fromtimestamp(built_at).strftime('%Y-%m-%d_%H-%M-%S')}.xlsx",
+                mime=report_export.XLSX_MIME,
+                type="primary",
                 key="download_all"
             )
-            st.success(f"সব রিপোর্ট প্রস্তুত! ফাইল: `all_reports_{timestamp}.xlsx`")
+        else:
+            st.button("**সব রিপোর্ট একসাথে (Excel)**", type="primary", disabled=True, key="download_all")
+    with col_all2:
+        if ready:
+            note = "নতুন ডেটাসহ আপডেট হচ্ছে..." if stale else "সর্বশেষ ডেটাসহ"
+            st.caption(f"{format_age(time.time() - built_at)} আগে তৈরি · {note}")
+            if builder.stats:
+                stats = builder.stats
+                st.caption(f"{stats['rows']:,} সারি · {stats['seconds']:.2f}s · {stats['rows_per_sec']:,.0f} rows/sec")
+        else:
+            st.info("রিপোর্ট ফাইল তৈরি হচ্ছে, কিছুক্ষণ পর রিফ্রেশ করুন")
+        if builder.last_error:
+            st.caption(f"শেষ বার তৈরি করতে সমস্যা: {builder.last_error}")
 
     st.markdown("---")
-    tab1, tab2, tab3 = st.tabs(["ক্রেতা", "বিক্রেতা", "লগ"])
+    formats = {"xlsx": "Excel"} | {k: v[0] for k, v in report_export.FORMATS.items()}
+    export_fmt = st.radio("ডাউনলোড ফরম্যাট", list(formats), format_func=formats.get, horizontal=True, key="export_fmt")
+    # Only the selected section runs its queries (st.tabs would run all three).
+    section = st.radio("রিপোর্ট", ["ক্রেতা", "বিক্রেতা", "কেনেনি", "লগ", "কর্মী ইতিহাস", "সার্চ"], horizontal=True, key="report_section")
 
-    with tab1:
-        conn = sqlite3.connect(DB_NAME)
-        df = pd.read_sql("SELECT e.employee_name AS 'Employee Name', t.employee_id AS 'Employee ID', t.total_quantity AS 'Total Tickets' FROM tickets t JOIN employees e ON t.employee_id = e.employee_id ORDER BY t.total_quantity DESC", conn)
-        conn.close()
+    if section == "ক্রেতা":
+        df = get_buyers()
         if not df.empty:
             st.dataframe(df, use_container_width=True)
-            ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            st.download_button("Download Buyers", to_excel(df, "Buyers"), f"buyers_{ts}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            download_report("Download Buyers", "buyers", export_fmt)
         else:
             st.info("কোনো ক্রেতা পাওয়া যায়নি")
 
-    with tab2:
+    elif section == "বিক্রেতা":
         df = get_seller_stats()
         df.columns = ['Seller', 'Tickets Sold']
         if not df.empty:
             for _, r in df.iterrows():
                 st.markdown(f"<span class='seller-badge'>{r['Seller']}</span> → {r['Tickets Sold']} টিকেট", unsafe_allow_html=True)
-            ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            st.download_button("Download Sellers", to_excel(df, "Sellers"), f"sellers_{ts}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            df_hourly = get_hourly_stats()
+            if not df_hourly.empty:
+                st.markdown("#### ঘণ্টাভিত্তিক বিক্রি")
+                st.bar_chart(df_hourly, x="hour", y="tickets", color="seller")
+            download_report("Download Sellers", "sellers", export_fmt)
         else:
             st.info("কোনো বিক্রয় নেই")
 
-    with tab3:
-        conn = sqlite3.connect(DB_NAME)
-        df = pd.read_sql("SELECT timestamp AS 'Date & Time', employee_name AS 'Employee', employee_id AS 'Employee ID', quantity AS 'Quantity', seller AS 'Seller', remark AS 'Remark' FROM sales ORDER BY id DESC", conn)
-        conn.close()
+    elif section == "কেনেনি":
+        # Page cursors: the last employee_id of each visited page (None = first page).
+        if "nonbuyer_cursors" not in st.session_state:
+            st.session_state.nonbuyer_cursors = [None]
+        cursors = st.session_state.nonbuyer_cursors
+        df = get_nonbuyers_page(cursors[-1])
+        if df.empty and len(cursors) > 1:      # roster shrank under us
+            cursors[:] = [None]
+            st.rerun()
         if not df.empty:
-            st.dataframe(df, use_container_width=True)
-            ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            st.download_button("Download Log", to_excel(df, "Log"), f"log_{ts}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            total = count_nonbuyers()
+            pages = max(1, -(-total // LOG_PAGE_SIZE))
+            start = (len(cursors) - 1) * LOG_PAGE_SIZE
+            st.dataframe(df, use_container_width=True, hide_index=True)
+            p1, p2, p3 = st.columns([1, 2, 1])
+            with p1:
+                if st.button("← আগের", key="nonbuyer_prev", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+            with p2:
+                st.caption(f"{start + 1}–{start + len(df)} / মোট {total} জন এখনো কেনেনি | পৃষ্ঠা {len(cursors)}/{pages}")
+            with p3:
+                if st.button("পরের →", key="nonbuyer_next", disabled=len(cursors) >= pages):
+                    cursors.append(df["Employee ID"].iloc[-1])
+                    st.rerun()
+            download_report("Download Non-buyers", "nonbuyers", export_fmt)
+        else:
+            st.success("সব কর্মী টিকেট কিনেছে")
+
+    elif section == "লগ":
+        f1, f2 = st.columns(2)
+        with f1:
+            log_seller = st.selectbox("Seller", ["সব"] + get_seller_stats()['seller'].tolist(), key="log_seller")
+        with f2:
+            log_emp = st.text_input("Employee ID", key="log_emp")
+        d1, d2 = st.columns(2)
+        with d1:
+            log_from = st.date_input("From", value=None, key="log_from")
+        with d2:
+            log_to = st.date_input("To", value=None, key="log_to")
+        filters = {
+            "seller": None if log_seller == "সব" else log_seller,
+            "emp_id": log_emp.strip() or None,
+            "start_ts": db_schema.to_epoch(datetime.combine(log_from, datetime.min.time())) if log_from else None,
+            "end_ts": db_schema.to_epoch(datetime.combine(log_to + timedelta(days=1), datetime.min.time())) if log_to else None,
+        }
+        # Page cursors: the id each visited page started below (None = newest).
+        if st.session_state.get("log_filters") != filters:
+            st.session_state.log_filters = filters
+            st.session_state.log_cursors = [None]
+        cursors = st.session_state.log_cursors
+
+        df = get_sales_page(filters, cursors[-1])
+        if not df.empty:
+            total = count_sales(filters)
+            pages = max(1, -(-total // LOG_PAGE_SIZE))
+            st.dataframe(df.drop(columns="id"), use_container_width=True, hide_index=True)
+            p1, p2, p3 = st.columns([1, 2, 1])
+            with p1:
+                if st.button("← আগের", key="log_prev", disabled=len(cursors) == 1):
+                    cursors.pop()
+                    st.rerun()
+            with p2:
+                st.caption(f"মোট {total} টি এন্ট্রি | পৃষ্ঠা {len(cursors)}/{pages}")
+            with p3:
+                if st.button("পরের →", key="log_next", disabled=len(cursors) >= pages):
+                    cursors.append(int(df["id"].iloc[-1]))
+                    st.rerun()
+            download_report("Download Log", "log", export_fmt, filters)
         else:
             st.info("কোনো লগ নেই")
 
+    elif section == "কর্মী ইতিহাস":
+        hist_emp = st.text_input("Employee ID", key="history_emp").strip()
+        if hist_emp:
+            name = get_employee(hist_emp)
+            if name:
+                st.markdown(f"**{name}** (`{hist_emp}`)")
+            show_history(hist_emp)
+
+    elif section == "সার্চ":
+        query = st.text_input("Remark / নাম / বিক্রেতা খুঁজুন", placeholder="wedding, family ...", key="search_text").strip()
+        if not search_available():
+            st.info("এই SQLite-এ FTS5 নেই, সার্চ চালু করা যায়নি")
+        elif query:
+            hits = search_sales(query)
+            st.caption(f"{len(hits)} টি ফলাফল" + (f" (প্রথম {SEARCH_LIMIT})" if len(hits) == SEARCH_LIMIT else ""))
+            for ts, emp_id, qty, remark, name, seller in hits:
+                st.markdown(
+                    f"{db_schema.format_ts(ts)} · <strong>{marked(name)}</strong> (<code>{html.escape(emp_id or '')}</code>) · "
+                    f"{qty} টি · <span class='seller-badge'>{marked(seller)}</span><br>{marked(remark)}",
+                    unsafe_allow_html=True,
+                )
+
     # === SUMMARY ===
     st.markdown("---")
     st.markdown("### Summary")
@@ -631,6 +1231,10 @@ elif page == "admin":
         st.stop()
     st.markdown("<h2>Admin Panel</h2>", unsafe_allow_html=True)
     if st.button("Home"): st.session_state.page = "home"; st.rerun()
+    last_sync = employee_sync_result()
+    if last_sync:
+        st.caption(f"employees.xlsx লোড ({last_sync['loaded_at'].strftime(db_schema.DISPLAY_FORMAT)}): "
+                   f"নতুন {last_sync['inserted']:,} · আপডেট {last_sync['updated']:,} · অপরিবর্তিত {last_sync['unchanged']:,}")
 
     with st.expander("Add New Admin"):
         with st.form("add_admin"):
@@ -638,18 +1242,24 @@ elif page == "admin":
             p = st.text_input("Password", type="password")
             if st.form_submit_button("Add"):
                 if u and p and u.lower() != "admin":
-                    conn = sqlite3.connect(DB_NAME)
-                    try:
-                        conn.execute("INSERT INTO admins VALUES (?, ?)", (u, hash_password(p)))
-                        conn.commit()
-                        st.success("Admin added")
-                    except:
-                        st.error("Username exists")
-                    conn.close()
-
-    if st.button("Download DB Backup"):
-        with open(DB_NAME, "rb") as f:
-            st.download_button("Download DB", f, file_name=DB_NAME)
+                    with get_db() as conn:
+                        try:
+                            conn.execute("INSERT INTO admins VALUES (?, ?)", (u, hash_password(p)))
+                            conn.commit()
+                            st.success("Admin added")
+                        except:
+                            st.error("Username exists")
+
+    # Built only when clicked (see backup_db_bytes).
+    st.download_button("Download DB Backup", backup_db_bytes, file_name=DB_NAME)
+
+    if st.button("Rebuild Report Tables"):
+        # Recount the summary counters, seller/hourly rollups and search index from the base tables.
+        with get_db() as conn:
+            db_schema.rebuild_counters(conn)
+            db_schema.rebuild_rollups(conn)
+            db_schema.rebuild_search(conn)
+        st.success("রিপোর্ট টেবিল নতুন করে গণনা করা হয়েছে")
     # === SUMMARY ===
     st.markdown("---")
     st.markdown("### Summary")
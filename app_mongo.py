@@ -1,10 +1,14 @@
 # app.py → FINAL VERSION WITH CORRECT LAST ENTRY ORDER (by MongoDB _id)
 import streamlit as st
 import pandas as pd
-import pymongo
+from bson import ObjectId
 from datetime import datetime, timedelta
 import hashlib
 import io
+import functools
+import mongo_client
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 
 # ==================== CONFIG ====================
 st.set_page_config(page_title="টিকেট বিতরণ", layout="centered")
@@ -13,12 +17,34 @@ TOTAL_TICKETS = 20000
 SESSION_TIMEOUT = timedelta(hours=2)
 
 # ==================== MONGO CONNECTION ====================
-client = pymongo.MongoClient(st.secrets["MONGO_URI"])
-db = client.ticketdb
+# One client per process: reruns reuse its pool instead of reconnecting.
+@st.cache_resource
+def get_client():
+    return mongo_client.make_client(st.secrets["MONGO_URI"])
+
+client = get_client()
+db = client[mongo_client.DB_NAME]
+
+# Indexes are created once per process; `python mongo_client.py` shows the query plans.
+@st.cache_resource
+def provision_indexes():
+    created, failed = mongo_client.ensure_indexes(db)
+    print(f"Mongo indexes ready: {', '.join(created)}")
+    for coll, error in failed:
+        print(f"Mongo index on {coll} not created: {error}")
+
+provision_indexes()
 employees = db.employees
 admins = db.admins
 tickets = db.tickets
 sales = db.sales
+buyers_view = db.buyers_view
+view_state = db.view_state
+# Report reads may lag a moment behind the booth, so they go to a secondary when there is one.
+report_employees = mongo_client.for_reports(employees)
+report_tickets = mongo_client.for_reports(tickets)
+report_sales = mongo_client.for_reports(sales)
+report_buyers_view = mongo_client.for_reports(buyers_view)
 
 # ==================== BEAUTIFUL & ORGANIZED CSS ====================
 st.markdown("""
@@ -193,42 +219,149 @@ def get_employee(eid):
     doc = employees.find_one({"employee_id": str(eid)})
     return doc["employee_name"] if doc else None
 
-def get_total_tickets(eid):
-    doc = tickets.find_one({"employee_id": str(eid)})
-    return doc["total_quantity"] if doc else 0
+class FirstSaleRace(Exception):
+    """Another booth created this employee's tickets document first."""
+
+def add_tickets(emp_id, qty, session):
+    # Quota-checked increment. The check and the increment are one
+    # conditional $inc, so two booths can't both pass the check. No upsert
+    # there: if the filter misses, the employee is over the limit (refused,
+    # nothing written), has no tickets document yet (created only if still
+    # absent), or another booth created it just now (retried through the
+    # $inc). Returns (ok, total): the new total, or the current one when
+    # refused.
+    doc = tickets.find_one_and_update(
+        {"employee_id": emp_id, "total_quantity": {"$lte": MAX_TICKETS_PER_EMPLOYEE - qty}},
+        {"$inc": {"total_quantity": qty}, "$currentDate": {"updated_at": True}},
+        return_document=ReturnDocument.AFTER, session=session
+    )
+    if doc is not None:
+        return True, doc["total_quantity"]
+    current = tickets.find_one({"employee_id": emp_id}, {"total_quantity": 1}, session=session)
+    total = current["total_quantity"] if current else 0
+    if total + qty > MAX_TICKETS_PER_EMPLOYEE:
+        return False, total
+    if current is not None:
+        raise FirstSaleRace()
+    res = tickets.update_one(
+        {"employee_id": emp_id},
+        {"$setOnInsert": {"total_quantity": qty}, "$currentDate": {"updated_at": True}},
+        upsert=True, session=session
+    )
+    if res.upserted_id is None:
+        raise FirstSaleRace()
+    return True, qty
+
+def run_sale_write(write):
+    # A lost first-sale race is retried; the next attempt goes through the $inc.
+    for attempt in range(3):
+        try:
+            return mongo_client.run_transaction(client, write)
+        except (FirstSaleRace, DuplicateKeyError):
+            if attempt == 2:
+                raise
 
 def add_sale(emp_id, name, qty, seller, remark=""):
-    ts = datetime.now().strftime("%d %b %Y, %I:%M %p")
-    sales.insert_one({
-        "employee_id": str(emp_id), "employee_name": name, "quantity": qty,
-        "seller": seller, "remark": remark, "timestamp": ts, "edited": False
-    })
-    current = get_total_tickets(emp_id)
-    tickets.update_one(
-        {"employee_id": str(emp_id)},
-        {"$set": {"total_quantity": current + qty}},
-        upsert=True
-    )
+    # Returns (sold, total): total is the new total, or the current one
+    # when the sale is refused.
+    emp_id = str(emp_id)
+    sale = {
+        "employee_id": emp_id, "employee_name": name, "quantity": qty, "seller": seller,
+        "remark": remark, "timestamp": datetime.now().strftime("%d %b %Y, %I:%M %p"), "edited": False
+    }
+
+    def write(session):
+        sold, total = add_tickets(emp_id, qty, session)
+        if sold:
+            sales.insert_one(dict(sale), session=session)   # fresh copy: a retried transaction needs a new _id
+        return sold, total
+
+    return run_sale_write(write)
 
 def edit_sale(sale_id, new_emp_id, new_name, new_qty, editor, edit_remark):
-    old_sale = sales.find_one({"_id": sale_id})
-    if not old_sale: return False
-    old_qty, old_emp_id = old_sale["quantity"], old_sale["employee_id"]
-
-    old_total = get_total_tickets(old_emp_id)
-    tickets.update_one({"employee_id": old_emp_id}, {"$set": {"total_quantity": old_total - old_qty}})
-    if old_total - old_qty <= 0:
-        tickets.delete_one({"employee_id": old_emp_id})
-
-    new_total = get_total_tickets(new_emp_id)
-    tickets.update_one({"employee_id": new_emp_id}, {"$set": {"total_quantity": new_total + new_qty}}, upsert=True)
-
-    sales.update_one({"_id": sale_id}, {"$set": {
-        "employee_id": str(new_emp_id), "employee_name": new_name, "quantity": new_qty,
+    # In a transaction (replica set / Atlas) an edit is two round-trips plus
+    # the commit: find_one_and_update swaps the sale and returns the old
+    # one, then one ordered bulk_write applies every $inc delta, the
+    # increase guarded by the quota. If the guard misses (over the limit,
+    # or a first ticket for that employee) one find_one settles it, and an
+    # over-limit edit aborts the transaction. A buyer who drops to zero
+    # costs one more write to buyers_view.
+    # Without transactions (standalone mongod) the increase goes first
+    # instead: it is the only step that can be refused, and when it is
+    # nothing has been written yet. Then the decreases, then the sale:
+    # four to six round-trips.
+    # Returns (status, total): status is "ok", "not_found" or "over_limit";
+    # total is the new employee's current count when refused.
+    new_emp_id = str(new_emp_id)
+    changes = {
+        "employee_id": new_emp_id, "employee_name": new_name, "quantity": new_qty,
         "edited": True, "edit_remark": f"Edited by {editor}: {edit_remark}",
         "edit_timestamp": datetime.now().strftime("%d %b %Y, %I:%M %p")
-    }})
-    return True
+    }
+
+    def deltas_from(old):
+        if old["employee_id"] == new_emp_id:
+            return [(new_emp_id, new_qty - old["quantity"])]
+        return [(old["employee_id"], -old["quantity"]), (new_emp_id, new_qty)]
+
+    def decrements(deltas):
+        ops = []
+        for eid, delta in deltas:
+            if delta < 0:
+                ops.append(UpdateOne({"employee_id": eid}, {"$inc": {"total_quantity": delta}, "$currentDate": {"updated_at": True}}))
+                ops.append(DeleteOne({"employee_id": eid, "total_quantity": {"$lte": 0}}))
+        return ops
+
+    def write_in_transaction(session):
+        old = sales.find_one_and_update(
+            {"_id": sale_id}, {"$set": changes}, {"employee_id": 1, "quantity": 1},
+            return_document=ReturnDocument.BEFORE, session=session
+        )
+        if not old:
+            return "not_found", None
+        deltas = deltas_from(old)
+        increases = [(eid, delta) for eid, delta in deltas if delta > 0]
+        ops = [UpdateOne({"employee_id": eid, "total_quantity": {"$lte": MAX_TICKETS_PER_EMPLOYEE - delta}},
+                         {"$inc": {"total_quantity": delta}, "$currentDate": {"updated_at": True}})
+               for eid, delta in increases] + decrements(deltas)
+        if not ops:
+            return "ok", None
+        res = tickets.bulk_write(ops, session=session)
+        if res.matched_count < sum(isinstance(op, UpdateOne) for op in ops):
+            for eid, delta in increases:
+                current = tickets.find_one({"employee_id": eid}, {"total_quantity": 1}, session=session)
+                total = current["total_quantity"] if current else 0
+                if total + delta > MAX_TICKETS_PER_EMPLOYEE:
+                    session.abort_transaction()     # rolls back the sale and the decreases
+                    return "over_limit", total
+                if current is None:
+                    tickets.update_one(
+                        {"employee_id": eid},
+                        {"$setOnInsert": {"total_quantity": delta}, "$currentDate": {"updated_at": True}},
+                        upsert=True, session=session
+                    )
+        if res.deleted_count:
+            # A buyer who dropped to zero leaves no tickets doc to refresh from.
+            buyers_view.delete_one({"_id": old["employee_id"]}, session=session)
+        return "ok", None
+
+    def write_in_order():
+        old = sales.find_one({"_id": sale_id}, {"employee_id": 1, "quantity": 1})
+        if not old:
+            return "not_found", None
+        deltas = deltas_from(old)
+        for eid, delta in deltas:
+            if delta > 0:
+                ok, total = add_tickets(eid, delta, None)
+                if not ok:
+                    return "over_limit", total
+        ops = decrements(deltas)
+        if ops and tickets.bulk_write(ops).deleted_count:
+            buyers_view.delete_one({"_id": old["employee_id"]})
+        sales.update_one({"_id": sale_id}, {"$set": changes})
+        return "ok", None
+
+    return run_sale_write(lambda session: write_in_order() if session is None else write_in_transaction(session))
 
 def get_stats():
     total_emp = employees.count_documents({})
@@ -239,9 +372,99 @@ def get_stats():
 
 def get_seller_stats():
     pipeline = [{"$group": {"_id": "$seller", "tickets_sold": {"$sum": "$quantity"}}}, {"$sort": {"tickets_sold": -1}}]
-    df = pd.DataFrame(list(sales.aggregate(pipeline)))
+    df = pd.DataFrame(list(report_sales.aggregate(pipeline)))
     return df.rename(columns={"_id": "Seller", "tickets_sold": "Tickets Sold"}) if not df.empty else pd.DataFrame(columns=["Seller", "Tickets Sold"])
 
+# Keyset pagination on _id. Sales store their time only as a display
+# string, so the date filter uses the creation time embedded in _id.
+LOG_PAGE_SIZE = 50
+
+def log_query(filters, before_id=None):
+    q = {}
+    if filters.get("seller"): q["seller"] = filters["seller"]
+    if filters.get("emp_id"): q["employee_id"] = filters["emp_id"]
+    id_range = {}
+    if filters.get("start"): id_range["$gte"] = ObjectId.from_datetime(filters["start"].astimezone())
+    if filters.get("end"): id_range["$lt"] = ObjectId.from_datetime(filters["end"].astimezone())
+    if before_id is not None: id_range["$lt"] = min(before_id, id_range.get("$lt", before_id))
+    if id_range: q["_id"] = id_range
+    return q
+
+def get_sales_page(filters, before_id=None):
+    return list(report_sales.find(log_query(filters, before_id)).sort("_id", -1).limit(LOG_PAGE_SIZE))
+
+@st.cache_data(ttl=30, max_entries=64)
+def count_sales(filters):
+    return report_sales.count_documents(log_query(filters))
+
+# Passed to st.download_button as a callable, so the full filtered log is
+# only read when the download is actually clicked.
+def export_log(filters):
+    return to_excel(pd.DataFrame(list(report_sales.find(log_query(filters), {"_id": 0}).sort("_id", -1))))
+
+# Employees with no tickets document: walk employees by employee_id and
+# $lookup each one in tickets (served by the tickets.employee_id index).
+def nonbuyer_pipeline(after_id=None):
+    match = {"employee_id": {"$gt": after_id}} if after_id is not None else {}
+    return [
+        {"$match": match},
+        {"$sort": {"employee_id": 1}},
+        {"$lookup": {"from": "tickets", "localField": "employee_id", "foreignField": "employee_id", "as": "t"}},
+        {"$match": {"t": {"$size": 0}}},
+        {"$project": {"_id": 0, "Employee ID": "$employee_id", "Employee Name": "$employee_name"}},
+    ]
+
+def get_nonbuyers_page(after_id=None):
+    return list(report_employees.aggregate(nonbuyer_pipeline(after_id) + [{"$limit": LOG_PAGE_SIZE}]))
+
+# Counted without the per-employee $lookup: all employees minus those with a
+# tickets doc, found by an indexed $in over the buyers' ids (at most
+# TOTAL_TICKETS of them). A tickets doc with no matching employee is
+# simply not matched, so it doesn't skew the count.
+@st.cache_data(ttl=30)
+def count_nonbuyers():
+    buyer_ids = report_tickets.distinct("employee_id")
+    return report_employees.count_documents({}) - report_employees.count_documents({"employee_id": {"$in": buyer_ids}})
+
+# Download callable: the full anti-join only runs when the button is clicked.
+def export_nonbuyers():
+    return to_excel(pd.DataFrame(list(report_employees.aggregate(nonbuyer_pipeline())), columns=["Employee ID", "Employee Name"]))
+
+# buyers_view: one doc per buyer {_id: employee_id, employee_name, total},
+# indexed on total. Sales stamp tickets.updated_at, so a refresh only
+# re-joins and $merges the tickets touched since the previous refresh;
+# view_state remembers the newest stamp merged so far. The window reaches
+# BUYERS_VIEW_OVERLAP further back for transactions that committed after a
+# later-stamped one; re-merging a doc is harmless.
+BUYER_COLUMNS = {"employee_name": "Employee Name", "_id": "Employee ID", "total": "Total Tickets"}
+BUYERS_VIEW_OVERLAP = timedelta(seconds=5)
+
+def refresh_buyers_view():
+    state = view_state.find_one({"_id": "buyers_view"})
+    newest = tickets.find_one({"updated_at": {"$ne": None}}, {"updated_at": 1}, sort=[("updated_at", -1)])
+    newest = newest["updated_at"] if newest else None
+    if state is None:
+        match = {}                                           # first run: build from every buyer
+    elif newest and (state["refreshed_to"] is None or newest > state["refreshed_to"]):
+        match = {"updated_at": {"$lte": newest}}
+        if state["refreshed_to"] is not None:
+            match["updated_at"]["$gte"] = state["refreshed_to"] - BUYERS_VIEW_OVERLAP
+    else:
+        return
+    tickets.aggregate([
+        {"$match": match},
+        {"$lookup": {"from": "employees", "localField": "employee_id", "foreignField": "employee_id", "as": "e"}},
+        {"$unwind": "$e"},
+        {"$project": {"_id": "$employee_id", "employee_name": "$e.employee_name", "total": "$total_quantity"}},
+        {"$merge": {"into": "buyers_view", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    view_state.update_one({"_id": "buyers_view"}, {"$set": {"refreshed_to": newest}}, upsert=True)
+
+def get_buyers():
+    refresh_buyers_view()
+    docs = report_buyers_view.find({}, {"employee_name": 1, "total": 1}).sort("total", -1)
+    return pd.DataFrame(list(docs), columns=list(BUYER_COLUMNS)).rename(columns=BUYER_COLUMNS)
+
 def to_excel(df, sheet="Sheet1"):
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -300,12 +523,12 @@ elif page == "home" and st.session_state.logged_in:
 
         if st.button("সাবমিট করুন", type="primary"):
             name = get_employee(emp_id)
+            sold, total = add_sale(emp_id, name, qty, st.session_state.username) if name else (False, 0)
             if not name:
                 st.error("Employee লিস্টে পাওয়া যায়নি")
-            elif get_total_tickets(emp_id) + qty > MAX_TICKETS_PER_EMPLOYEE:
-                st.error(f"সর্বোচ্চ {MAX_TICKETS_PER_EMPLOYEE} টি। ইতিমধ্যে {get_total_tickets(emp_id)} টি আছে")
+            elif not sold:
+                st.error(f"সর্বোচ্চ {MAX_TICKETS_PER_EMPLOYEE} টি। ইতিমধ্যে {total} টি আছে")
             else:
-                add_sale(emp_id, name, qty, st.session_state.username)
                 st.success(f"সফল: {name} ({emp_id}) → {qty} টি টিকেট")
                 st.rerun()
 
@@ -343,10 +566,16 @@ elif page == "home" and st.session_state.logged_in:
                         st.error("কারণ লিখুন")
                     else:
                         new_name = get_employee(new_id) or "Unknown"
-                        edit_sale(s["_id"], new_id, new_name, new_qty, st.session_state.username, remark)
-                        st.success("সংশোধন সফল!")
-                        del st.session_state.edit_sale
-                        st.rerun()
+                        result, current = edit_sale(s["_id"], new_id, new_name, new_qty, st.session_state.username, remark)
+                        if result == "over_limit":
+                            st.error(f"সর্বোচ্চ {MAX_TICKETS_PER_EMPLOYEE} টি। {new_id} এর ইতিমধ্যে {current} টি আছে")
+                        elif result == "not_found":
+                            st.error("এন্ট্রিটি আর পাওয়া যায়নি")
+                            del st.session_state.edit_sale
+                        else:
+                            st.success("সংশোধন সফল!")
+                            del st.session_state.edit_sale
+                            st.rerun()
             with c2:
                 if st.button("বাতিল"): del st.session_state.edit_sale; st.rerun()
 
@@ -361,14 +590,9 @@ elif page == "report":
     if st.button("Home"): st.session_state.page = "home"; st.rerun()
 
     if st.button("**সব রিপোর্ট একসাথে (Excel)**", type="primary"):
-        df_buyers = pd.DataFrame(list(tickets.aggregate([
-            {"$lookup": {"from": "employees", "localField": "employee_id", "foreignField": "employee_id", "as": "e"}},
-            {"$unwind": "$e"},
-            {"$project": {"Employee Name": "$e.employee_name", "Employee ID": "$employee_id", "Total Tickets": "$total_quantity"}},
-            {"$sort": {"Total Tickets": -1}}
-        ])))
+        df_buyers = get_buyers()
         df_sellers = get_seller_stats()
-        df_log = pd.DataFrame(list(sales.find({}, {"_id": 0}).sort("_id", -1)))  # ← এখানেও পরিবর্তন
+        df_log = pd.DataFrame(list(report_sales.find({}, {"_id": 0}).sort("_id", -1)))  # ← এখানেও পরিবর্তন
 
         output = io.BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -379,15 +603,10 @@ elif page == "report":
         st.download_button("Download All Reports", output, f"all_reports_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
     st.markdown("---")
-    tab1, tab2, tab3 = st.tabs(["ক্রেতা", "বিক্রেতা", "লগ"])
+    tab1, tab2, tab_non, tab3 = st.tabs(["ক্রেতা", "বিক্রেতা", "কেনেনি", "লগ"])
 
     with tab1:
-        df = pd.DataFrame(list(tickets.aggregate([
-            {"$lookup": {"from": "employees", "localField": "employee_id", "foreignField": "employee_id", "as": "e"}},
-            {"$unwind": "$e"},
-            {"$project": {"Employee Name": "$e.employee_name", "Employee ID": "$employee_id", "Total Tickets": "$total_quantity"}},
-            {"$sort": {"Total Tickets": -1}}
-        ])))
+        df = get_buyers()
         if not df.empty:
             st.dataframe(df, use_container_width=True)
             st.download_button("Download Buyers", to_excel(df), "buyers.xlsx")
@@ -403,11 +622,55 @@ elif page == "report":
         else:
             st.info("কোনো বিক্রয় নেই")
 
+    with tab_non:
+        if "nonbuyer_cursors" not in st.session_state: st.session_state.nonbuyer_cursors = [None]
+        cursors = st.session_state.nonbuyer_cursors
+        docs = get_nonbuyers_page(cursors[-1])
+        if docs:
+            total = count_nonbuyers()
+            pages = max(1, -(-total // LOG_PAGE_SIZE))
+            start = (len(cursors) - 1) * LOG_PAGE_SIZE
+            st.dataframe(pd.DataFrame(docs), use_container_width=True, hide_index=True)
+            p1, p2, p3 = st.columns([1, 2, 1])
+            with p1:
+                if st.button("← আগের", key="nonbuyer_prev", disabled=len(cursors) == 1): cursors.pop(); st.rerun()
+            with p2: st.caption(f"{start + 1}–{start + len(docs)} / মোট {total} জন এখনো কেনেনি | পৃষ্ঠা {len(cursors)}/{pages}")
+            with p3:
+                if st.button("পরের →", key="nonbuyer_next", disabled=len(cursors) >= pages): cursors.append(docs[-1]["Employee ID"]); st.rerun()
+            st.download_button("Download Non-buyers", export_nonbuyers, "nonbuyers.xlsx")
+        else:
+            st.success("সব কর্মী টিকেট কিনেছে")
+
     with tab3:
-        df = pd.DataFrame(list(sales.find({}, {"_id": 0}).sort("_id", -1)))  # ← এখানেও পরিবর্তন
-        if not df.empty:
-            st.dataframe(df, use_container_width=True)
-            st.download_button("Download Log", to_excel(df), "log.xlsx")
+        f1, f2 = st.columns(2)
+        with f1: log_seller = st.selectbox("Seller", ["সব"] + get_seller_stats()["Seller"].tolist(), key="log_seller")
+        with f2: log_emp = st.text_input("Employee ID", key="log_emp")
+        d1, d2 = st.columns(2)
+        with d1: log_from = st.date_input("From", value=None, key="log_from")
+        with d2: log_to = st.date_input("To", value=None, key="log_to")
+        filters = {
+            "seller": None if log_seller == "সব" else log_seller,
+            "emp_id": log_emp.strip() or None,
+            "start": datetime.combine(log_from, datetime.min.time()) if log_from else None,
+            "end": datetime.combine(log_to + timedelta(days=1), datetime.min.time()) if log_to else None,
+        }
+        if st.session_state.get("log_filters") != filters:
+            st.session_state.log_filters = filters
+            st.session_state.log_cursors = [None]
+        cursors = st.session_state.log_cursors
+
+        docs = get_sales_page(filters, cursors[-1])
+        if docs:
+            total = count_sales(filters)
+            pages = max(1, -(-total // LOG_PAGE_SIZE))
+            st.dataframe(pd.DataFrame(docs).drop(columns="_id"), use_container_width=True, hide_index=True)
+            p1, p2, p3 = st.columns([1, 2, 1])
+            with p1:
+                if st.button("← আগের", key="log_prev", disabled=len(cursors) == 1): cursors.pop(); st.rerun()
+            with p2: st.caption(f"মোট {total} টি এন্ট্রি | পৃষ্ঠা {len(cursors)}/{pages}")
+            with p3:
+                if st.button("পরের →", key="log_next", disabled=len(cursors) >= pages): cursors.append(docs[-1]["_id"]); st.rerun()
+            st.download_button("Download Log", functools.partial(export_log, filters), "log.xlsx")
         else:
             st.info("কোনো লগ নেই")
 
@@ -9,9 +9,9 @@
 import sqlite3
 import pandas as pd
 import os
-import shutil
 from datetime import datetime
 import hashlib
+import db_schema
 
 # === কনফিগারেশন ===
 DB_NAME = "ticket_distribution.db"
@@ -32,21 +32,36 @@ backup_excel_path = os.path.join(BACKUP_DIR, f"backup_{timestamp}.xlsx")
 def hash_password(pw):
     return hashlib.sha256(pw.encode()).hexdigest()
 
+# === .db ব্যাকআপ ===
+def backup_db(db_path, backup_path):
+    """SQLite backup API দিয়ে কপি করে — WAL ফাইলে থাকা কমিটও ব্যাকআপে আসে"""
+    src = sqlite3.connect(db_path)
+    dst = sqlite3.connect(backup_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+def remove_db(db_path):
+    """ডাটাবেস ও তার -wal / -shm ফাইল মুছে ফেলে"""
+    for path in (db_path, db_path + "-wal", db_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
 # === এক্সেলে রপ্তানি ===
 def export_to_excel(db_path, excel_path):
     """সব টেবিল এক্সেলে রপ্তানি করে"""
     try:
         conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = cursor.fetchall()
+        tables = db_schema.data_tables(conn)      # sales_fts ও তার shadow টেবিল বাদ
         
         if not tables:
             print("কোনো টেবিল পাওয়া যায়নি।")
             return
         
         with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-            for (table_name,) in tables:
+            for table_name in tables:
                 df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
                 df.to_excel(writer, sheet_name=table_name, index=False)
                 print(f"টেবিল '{table_name}' → {table_name} শিটে সংরক্ষিত")
@@ -61,18 +76,7 @@ def create_new_db():
     """নতুন ডাটাবেস + টেবিল তৈরি করে"""
     try:
         conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS employees (
-                     employee_id TEXT PRIMARY KEY, employee_name TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS admins (
-                     username TEXT PRIMARY KEY, password TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS tickets (
-                     employee_id TEXT PRIMARY KEY, total_quantity INTEGER DEFAULT 0, first_timestamp TEXT)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS sales (
-                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                     employee_id TEXT, employee_name TEXT, quantity INTEGER,
-                     seller TEXT, timestamp TEXT)''')
-        conn.commit()
+        db_schema.upgrade(conn)
         conn.close()
         print(f"নতুন ডাটাবেস তৈরি: {DB_NAME}")
     except Exception as e:
@@ -113,10 +117,11 @@ def load_employees_from_excel():
         df['employee_name'] = df['employee_name'].astype(str).str.strip()
         
         conn = sqlite3.connect(DB_NAME)
-        df.to_sql('employees', conn, if_exists='replace', index=False)
+        counts = db_schema.upsert_employees(conn, df.itertuples(index=False, name=None))
         conn.close()
         
-        print(f"সফল! {len(df)} জন কর্মী লোড হয়েছে: {EMPLOYEES_XLSX}")
+        print(f"সফল! {len(df)} জন কর্মী লোড হয়েছে: {EMPLOYEES_XLSX}")
+        print(f"→ নতুন: {counts['inserted']}, আপডেট: {counts['updated']}, অপরিবর্তিত: {counts['unchanged']}")
     except Exception as e:
         print(f"কর্মী লোডে সমস্যা: {e}")
 
@@ -130,7 +135,7 @@ def main():
         print(f"পুরাতন ডাটাবেস পাওয়া গেছে: {DB_NAME}")
         
         # ব্যাকআপ .db
-        shutil.copy2(DB_NAME, backup_db_path)
+        backup_db(DB_NAME, backup_db_path)
         print(f"ডাটাবেস ব্যাকআপ: {backup_db_path}")
         
         # এক্সেল ব্যাকআপ
@@ -138,7 +143,7 @@ def main():
             export_to_excel(DB_NAME, backup_excel_path)
         
         # মুছে ফেলা
-        os.remove(DB_NAME)
+        remove_db(DB_NAME)
         print(f"পুরাতন ডাটাবেস মুছে ফেলা হয়েছে")
     else:
         print("পুরাতন ডাটাবেস পাওয়া যায়নি। নতুন তৈরি হচ্ছে...")
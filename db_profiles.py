@@ -0,0 +1,157 @@
+# db_profiles.py
+# ticket_distribution.db-এর স্টোরেজ প্রোফাইল (PRAGMA সেট)
+# • app.py প্রতিটি কানেকশনে নির্বাচিত প্রোফাইল প্রয়োগ করে
+# • প্রোফাইল বাছাই: TICKET_DB_PROFILE এনভায়রনমেন্ট ভ্যারিয়েবল (ডিফল্ট "wal")
+# • সরাসরি চালালে (python db_profiles.py) সব প্রোফাইলের বেঞ্চমার্ক দেখায়
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# === কনফিগারেশন ===
+DB_NAME = "ticket_distribution.db"
+DEFAULT_PROFILE = "wal"
+
+# journal_mode is stored in the database file itself; everything else is
+# per-connection and has to be applied every time a connection is opened.
+PROFILES = {
+    # Booths write while reports read: readers never block the writer.
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,       # KiB → 64 MB
+        "temp_store": "MEMORY",
+    },
+    # WAL, but fsync on every commit (survives power loss, slower writes).
+    "wal_durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+    },
+    # The old behaviour: rollback journal, only a busy timeout added.
+    "legacy": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+        "mmap_size": 0,
+        "cache_size": -2000,
+        "temp_store": "DEFAULT",
+    },
+}
+
+CONNECTION_PRAGMAS = ("synchronous", "busy_timeout", "mmap_size", "cache_size", "temp_store")
+
+def get_profile(name=None):
+    """নাম অনুযায়ী প্রোফাইল (না থাকলে ডিফল্ট)"""
+    name = name or os.environ.get("TICKET_DB_PROFILE", DEFAULT_PROFILE)
+    return PROFILES.get(name, PROFILES[DEFAULT_PROFILE])
+
+def apply_journal_mode(conn, profile):
+    """ডাটাবেস ফাইলের journal mode সেট করে (স্টার্টআপে একবার)"""
+    return conn.execute(f"PRAGMA journal_mode={profile['journal_mode']}").fetchone()[0]
+
+def apply_connection_pragmas(conn, profile):
+    """প্রতি কানেকশনের PRAGMA সেট করে"""
+    for key in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {key}={profile[key]}")
+
+# === বেঞ্চমার্ক ===
+BENCH_SECONDS = 5
+BENCH_WRITERS = 10      # একসাথে কতগুলো বুথ
+BENCH_READERS = 2       # একসাথে কতজন রিপোর্ট দেখছে
+
+def _bench_connect(path, profile):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    apply_connection_pragmas(conn, profile)
+    return conn
+
+def _writer(path, profile, stop, results, n):
+    conn = _bench_connect(path, profile)
+    stats = {"writes": 0, "reads": 0, "locked": 0}
+    i = 0
+    while not stop.is_set():
+        emp_id = f"BENCH{n}-{i}"
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO tickets (employee_id, total_quantity) VALUES (?, 1) "
+                         "ON CONFLICT(employee_id) DO UPDATE SET total_quantity = total_quantity + 1", (emp_id,))
+            conn.execute("INSERT INTO sales (employee_id, employee_name, quantity, seller, remark, timestamp) "
+                         "VALUES (?, 'bench', 1, 'bench', '', '')", (emp_id,))
+            conn.commit()
+            stats["writes"] += 1
+        except sqlite3.OperationalError:
+            conn.rollback()
+            stats["locked"] += 1
+        i += 1
+    conn.close()
+    results.append(stats)
+
+def _reader(path, profile, stop, results):
+    conn = _bench_connect(path, profile)
+    stats = {"writes": 0, "reads": 0, "locked": 0}
+    while not stop.is_set():
+        try:
+            conn.execute("SELECT * FROM sales ORDER BY id DESC").fetchall()
+            stats["reads"] += 1
+        except sqlite3.OperationalError:
+            stats["locked"] += 1
+    conn.close()
+    results.append(stats)
+
+def benchmark(name, source=DB_NAME, seconds=BENCH_SECONDS, writers=BENCH_WRITERS, readers=BENCH_READERS):
+    """ডাটাবেসের একটি কপিতে প্রোফাইল চালিয়ে writes/s, reads/s ও lock এরর মাপে"""
+    profile = PROFILES[name]
+    tmp_dir = tempfile.mkdtemp()
+    path = os.path.join(tmp_dir, "bench.db")
+    try:
+        shutil.copy2(source, path)
+        conn = sqlite3.connect(path)
+        apply_journal_mode(conn, profile)
+        conn.close()
+
+        results = []
+        stop = threading.Event()
+        threads = [threading.Thread(target=_writer, args=(path, profile, stop, results, n)) for n in range(writers)]
+        threads += [threading.Thread(target=_reader, args=(path, profile, stop, results)) for _ in range(readers)]
+        for t in threads:
+            t.start()
+        time.sleep(seconds)
+        stop.set()
+        for t in threads:
+            t.join()
+        total = {k: sum(r[k] for r in results) for k in ("writes", "reads", "locked")}
+        return {"writes": total["writes"] / seconds, "reads": total["reads"] / seconds, "locked": total["locked"]}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def main():
+    print("স্টোরেজ প্রোফাইল বেঞ্চমার্ক শুরু হচ্ছে...\n")
+    print(f"তারিখ: {datetime.now().strftime('%d %B %Y, %I:%M %p')}")
+    print(f"ডাটাবেস: {DB_NAME} | {BENCH_WRITERS} বুথ + {BENCH_READERS} রিপোর্ট | {BENCH_SECONDS}s প্রতি প্রোফাইল\n")
+
+    if not os.path.exists(DB_NAME):
+        print(f"সমস্যা: {DB_NAME} পাওয়া যায়নি।")
+        return
+
+    print(f"{'profile':<14}{'writes/s':>10}{'reads/s':>10}{'locked':>8}")
+    for name in PROFILES:
+        r = benchmark(name)
+        print(f"{name:<14}{r['writes']:>10.1f}{r['reads']:>10.1f}{r['locked']:>8}")
+
+    print(f"\nবর্তমান প্রোফাইল: {os.environ.get('TICKET_DB_PROFILE', DEFAULT_PROFILE)}")
+    print("পরিবর্তন করতে: TICKET_DB_PROFILE=<profile> streamlit run app.py")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nবন্ধ করা হয়েছে।")
@@ -0,0 +1,329 @@
+# db_schema.py
+# ticket_distribution.db-এর স্কিমা ও কর্মী ইনজেস্ট
+# • upgrade(): টেবিল তৈরি + পুরাতন ডাটাবেস মেরামত + ইনডেক্স (স্টার্টআপে চলে)
+# • upsert_employees(): কর্মী তালিকা এক ট্রানজেকশনে আপসার্ট করে
+# • sales_fts: remark / নাম / বিক্রেতার উপর FTS5 সার্চ ইনডেক্স (ট্রিগার দিয়ে হালনাগাদ)
+# • সরাসরি চালালে (python db_schema.py) কাউন্টার, রোলআপ ও সার্চ ইনডেক্স নতুন করে তৈরি করে
+# app.py, backup_and_reset.py ও export_db_to_json.py এটা ব্যবহার করে
+
+import sqlite3
+from datetime import datetime
+
+DB_NAME = "ticket_distribution.db"
+
+# Display format of the legacy sales.timestamp column (still written for the
+# export/migration scripts); the app itself sorts and filters on sales.ts.
+DISPLAY_FORMAT = "%d %b %Y, %I:%M %p"
+LEGACY_FORMATS = [DISPLAY_FORMAT, "%Y-%m-%d %H:%M:%S"]
+
+# === টেবিল ===
+TABLES = [
+    '''CREATE TABLE IF NOT EXISTS employees (employee_id TEXT PRIMARY KEY, employee_name TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS admins (username TEXT PRIMARY KEY, password TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS tickets (employee_id TEXT PRIMARY KEY, total_quantity INTEGER DEFAULT 0, first_timestamp TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS sales (
+       id INTEGER PRIMARY KEY AUTOINCREMENT,
+       employee_id TEXT, employee_name TEXT, quantity INTEGER,
+       seller TEXT, remark TEXT, timestamp TEXT, ts INTEGER)''',
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_sales_employee ON sales(employee_id)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_seller_qty ON sales(seller, quantity)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_ts ON sales(ts)",
+    "CREATE INDEX IF NOT EXISTS idx_sales_seller_id ON sales(seller, id)",
+]
+
+# === কাউন্টার ===
+# One row holding the summary-card numbers, kept in step by triggers so
+# get_stats() is a primary-key read instead of three aggregates.
+COUNTERS_TABLE = '''CREATE TABLE IF NOT EXISTS counters (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    employees INTEGER NOT NULL DEFAULT 0,
+    buyers INTEGER NOT NULL DEFAULT 0,
+    sold INTEGER NOT NULL DEFAULT 0)'''
+
+COUNTER_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS trg_counters_employees_ins AFTER INSERT ON employees BEGIN
+       UPDATE counters SET employees = employees + 1 WHERE id = 1; END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_counters_employees_del AFTER DELETE ON employees BEGIN
+       UPDATE counters SET employees = employees - 1 WHERE id = 1; END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_counters_tickets_ins AFTER INSERT ON tickets BEGIN
+       UPDATE counters SET buyers = buyers + 1, sold = sold + COALESCE(NEW.total_quantity, 0) WHERE id = 1; END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_counters_tickets_del AFTER DELETE ON tickets BEGIN
+       UPDATE counters SET buyers = buyers - 1, sold = sold - COALESCE(OLD.total_quantity, 0) WHERE id = 1; END''',
+    '''CREATE TRIGGER IF NOT EXISTS trg_counters_tickets_upd AFTER UPDATE OF total_quantity ON tickets BEGIN
+       UPDATE counters SET sold = sold + COALESCE(NEW.total_quantity, 0) - COALESCE(OLD.total_quantity, 0) WHERE id = 1; END''',
+]
+
+# Bumped on any change to employees; the in-memory employee directory in
+# app.py reloads only when this moves.
+ROSTER_VERSION_TRIGGERS = [
+    f'''CREATE TRIGGER IF NOT EXISTS trg_roster_version_{name} AFTER {event} ON employees BEGIN
+       UPDATE counters SET roster_version = roster_version + 1 WHERE id = 1; END'''
+    for name, event in [("ins", "INSERT"), ("del", "DELETE"), ("upd", "UPDATE")]
+]
+
+def upgrade(conn):
+    """সব টেবিল তৈরি করে, পুরাতন স্কিমা মেরামত করে এবং ইনডেক্স বানায়"""
+    for ddl in TABLES:
+        conn.execute(ddl)
+    conn.commit()
+    repaired = repair_employees_table(conn)
+    _add_column(conn, "sales", "ts", "INTEGER")
+    for ddl in INDEXES:
+        conn.execute(ddl)
+    conn.commit()
+    backfill_sales_ts(conn)
+
+    new_counters = not _table_exists(conn, "counters")
+    conn.execute(COUNTERS_TABLE)
+    _add_column(conn, "counters", "roster_version", "INTEGER NOT NULL DEFAULT 0")
+    for ddl in COUNTER_TRIGGERS + ROSTER_VERSION_TRIGGERS:
+        conn.execute(ddl)
+    conn.commit()
+    if new_counters or repaired:
+        rebuild_counters(conn)
+
+    new_rollups = not _table_exists(conn, "seller_totals")
+    for ddl in ROLLUP_TABLES + ROLLUP_TRIGGERS:
+        conn.execute(ddl)
+    conn.commit()
+    if new_rollups:
+        rebuild_rollups(conn)
+
+    create_search(conn)
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+def _has_primary_key(conn, table, column):
+    return any(row[1] == column and row[5] for row in conn.execute(f"PRAGMA table_info({table})"))
+
+def _add_column(conn, table, column, decl):
+    if any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})")):
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    conn.commit()
+    return True
+
+def repair_employees_table(conn):
+    """to_sql(replace) দিয়ে হারানো employee_id PRIMARY KEY ফিরিয়ে আনে"""
+    if _has_primary_key(conn, "employees", "employee_id"):
+        return False
+    # Rebuild into a keyed table; duplicate IDs collapse to the last row seen.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DROP TABLE IF EXISTS employees_rebuild")
+        conn.execute("CREATE TABLE employees_rebuild (employee_id TEXT PRIMARY KEY, employee_name TEXT)")
+        conn.execute("""INSERT OR REPLACE INTO employees_rebuild (employee_id, employee_name)
+                        SELECT TRIM(CAST(employee_id AS TEXT)), employee_name FROM employees
+                        WHERE employee_id IS NOT NULL ORDER BY rowid""")
+        conn.execute("DROP TABLE employees")
+        conn.execute("ALTER TABLE employees_rebuild RENAME TO employees")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def rebuild_counters(conn):
+    """counters টেবিল আসল টেবিল থেকে আবার গণনা করে"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+            INSERT INTO counters (id, employees, buyers, sold)
+            SELECT 1, (SELECT COUNT(*) FROM employees), (SELECT COUNT(*) FROM tickets),
+                   (SELECT COALESCE(SUM(total_quantity), 0) FROM tickets) WHERE true
+            ON CONFLICT(id) DO UPDATE SET employees = excluded.employees, buyers = excluded.buyers,
+                                          sold = excluded.sold, roster_version = roster_version + 1
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# === রোলআপ ===
+# Per-seller and per-hour totals maintained by triggers on sales, so the
+# seller leaderboard and the hourly chart never rescan the sales log.
+ROLLUP_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS seller_totals (
+       seller TEXT PRIMARY KEY, tickets INTEGER NOT NULL DEFAULT 0, sales_count INTEGER NOT NULL DEFAULT 0)''',
+    '''CREATE TABLE IF NOT EXISTS hourly_totals (
+       hour INTEGER NOT NULL, seller TEXT NOT NULL, tickets INTEGER NOT NULL DEFAULT 0,
+       PRIMARY KEY (hour, seller))''',
+]
+
+_ROLLUP_ADD = '''
+       INSERT INTO seller_totals (seller, tickets, sales_count)
+       SELECT COALESCE(NEW.seller, ''), COALESCE(NEW.quantity, 0), 1 WHERE true
+       ON CONFLICT(seller) DO UPDATE SET tickets = tickets + excluded.tickets, sales_count = sales_count + 1;
+       INSERT INTO hourly_totals (hour, seller, tickets)
+       SELECT NEW.ts / 3600 * 3600, COALESCE(NEW.seller, ''), COALESCE(NEW.quantity, 0) WHERE NEW.ts IS NOT NULL
+       ON CONFLICT(hour, seller) DO UPDATE SET tickets = tickets + excluded.tickets;'''
+
+_ROLLUP_REMOVE = '''
+       UPDATE seller_totals SET tickets = tickets - COALESCE(OLD.quantity, 0), sales_count = sales_count - 1
+       WHERE seller = COALESCE(OLD.seller, '');
+       DELETE FROM seller_totals WHERE seller = COALESCE(OLD.seller, '') AND sales_count <= 0;
+       UPDATE hourly_totals SET tickets = tickets - COALESCE(OLD.quantity, 0)
+       WHERE hour = OLD.ts / 3600 * 3600 AND seller = COALESCE(OLD.seller, '');
+       DELETE FROM hourly_totals WHERE hour = OLD.ts / 3600 * 3600 AND seller = COALESCE(OLD.seller, '') AND tickets <= 0;'''
+
+ROLLUP_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_rollup_sales_ins AFTER INSERT ON sales BEGIN {_ROLLUP_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_rollup_sales_del AFTER DELETE ON sales BEGIN {_ROLLUP_REMOVE} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_rollup_sales_upd AFTER UPDATE OF seller, quantity, ts ON sales BEGIN {_ROLLUP_REMOVE} {_ROLLUP_ADD} END",
+]
+
+def rebuild_rollups(conn):
+    """seller_totals ও hourly_totals sales টেবিল থেকে আবার গণনা করে"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM seller_totals")
+        conn.execute("DELETE FROM hourly_totals")
+        conn.execute("""
+            INSERT INTO seller_totals (seller, tickets, sales_count)
+            SELECT COALESCE(seller, ''), COALESCE(SUM(quantity), 0), COUNT(*) FROM sales GROUP BY COALESCE(seller, '')
+        """)
+        conn.execute("""
+            INSERT INTO hourly_totals (hour, seller, tickets)
+            SELECT ts / 3600 * 3600, COALESCE(seller, ''), COALESCE(SUM(quantity), 0) FROM sales
+            WHERE ts IS NOT NULL GROUP BY ts / 3600 * 3600, COALESCE(seller, '')
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# === সার্চ ===
+# External-content FTS5 index over sales; the text lives only in sales and
+# triggers keep the index in step. Bengali vowel signs are combining marks,
+# so M* is added to the token characters or words would split at every sign.
+SEARCH_TABLE = '''CREATE VIRTUAL TABLE IF NOT EXISTS sales_fts USING fts5(
+    remark, employee_name, seller, content='sales', content_rowid='id',
+    tokenize="unicode61 categories 'L* N* Co M*'")'''
+
+_SEARCH_ADD = "INSERT INTO sales_fts (rowid, remark, employee_name, seller) VALUES (NEW.id, NEW.remark, NEW.employee_name, NEW.seller);"
+_SEARCH_REMOVE = ("INSERT INTO sales_fts (sales_fts, rowid, remark, employee_name, seller) "
+                  "VALUES ('delete', OLD.id, OLD.remark, OLD.employee_name, OLD.seller);")
+
+SEARCH_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS trg_search_sales_ins AFTER INSERT ON sales BEGIN {_SEARCH_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_search_sales_del AFTER DELETE ON sales BEGIN {_SEARCH_REMOVE} END",
+    f"CREATE TRIGGER IF NOT EXISTS trg_search_sales_upd AFTER UPDATE OF remark, employee_name, seller ON sales BEGIN {_SEARCH_REMOVE} {_SEARCH_ADD} END",
+]
+
+def create_search(conn):
+    """sales_fts ও ট্রিগার তৈরি করে; SQLite-এ FTS5 না থাকলে False"""
+    new_index = not _table_exists(conn, "sales_fts")
+    try:
+        conn.execute(SEARCH_TABLE)
+    except sqlite3.OperationalError:     # built without FTS5: search stays off
+        return False
+    for ddl in SEARCH_TRIGGERS:
+        conn.execute(ddl)
+    conn.commit()
+    if new_index:
+        rebuild_search(conn)
+    return True
+
+def data_tables(conn):
+    """ব্যাকআপ/রপ্তানির টেবিল — virtual টেবিল (sales_fts) ও তার shadow টেবিল বাদে"""
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='table'").fetchall()
+    virtual = [name for name, sql in rows if (sql or "").upper().startswith("CREATE VIRTUAL")]
+    return [name for name, _ in rows if not any(name == v or name.startswith(v + "_") for v in virtual)]
+
+def rebuild_search(conn):
+    """sales_fts ইনডেক্স sales টেবিল থেকে আবার তৈরি করে"""
+    if not _table_exists(conn, "sales_fts"):
+        return
+    conn.execute("INSERT INTO sales_fts (sales_fts) VALUES ('rebuild')")
+    conn.commit()
+
+def fts_query(text):
+    """ব্যবহারকারীর লেখা → নিরাপদ FTS5 কুয়েরি (প্রতিটি শব্দ prefix হিসেবে, সব শব্দ মিলতে হবে)"""
+    words = text.split()
+    return " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+
+# === সময় ===
+def to_epoch(dt=None):
+    """datetime → epoch সেকেন্ড (sales.ts)"""
+    return int((dt or datetime.now()).timestamp())
+
+def format_ts(ts):
+    """sales.ts → প্রদর্শনের স্ট্রিং (শুধু রেন্ডার করার সময়)"""
+    return datetime.fromtimestamp(ts).strftime(DISPLAY_FORMAT) if ts is not None else ""
+
+def parse_legacy_timestamp(raw):
+    """পুরাতন timestamp স্ট্রিং → epoch সেকেন্ড (না মিললে None)"""
+    if not raw:
+        return None
+    raw = raw.strip()
+    for fmt in LEGACY_FORMATS:
+        try:
+            return to_epoch(datetime.strptime(raw[:19] if "-" in raw else raw, fmt))
+        except ValueError:
+            continue
+    return None
+
+def backfill_sales_ts(conn):
+    """যেসব বিক্রয়ে ts নেই সেগুলো timestamp স্ট্রিং থেকে পূরণ করে"""
+    conn.create_function("parse_legacy_timestamp", 1, parse_legacy_timestamp, deterministic=True)
+    cur = conn.execute("UPDATE sales SET ts = parse_legacy_timestamp(timestamp) WHERE ts IS NULL")
+    conn.commit()
+    return cur.rowcount
+
+# === কর্মী ইনজেস্ট ===
+def upsert_employees(conn, rows):
+    """(employee_id, employee_name) সারিগুলো এক ট্রানজেকশনে আপসার্ট করে।
+    ফেরত দেয়: {"inserted": n, "updated": n, "unchanged": n}"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS employees_stage (employee_id TEXT PRIMARY KEY, employee_name TEXT)")
+        conn.execute("DELETE FROM employees_stage")
+        conn.executemany("INSERT OR REPLACE INTO employees_stage VALUES (?, ?)",
+                         ((str(eid), name) for eid, name in rows))
+
+        inserted, updated, unchanged = conn.execute("""
+            SELECT COALESCE(SUM(e.employee_id IS NULL), 0),
+                   COALESCE(SUM(e.employee_id IS NOT NULL AND e.employee_name IS NOT s.employee_name), 0),
+                   COALESCE(SUM(e.employee_id IS NOT NULL AND e.employee_name IS s.employee_name), 0)
+            FROM employees_stage s LEFT JOIN employees e ON e.employee_id = s.employee_id
+        """).fetchone()
+
+        conn.execute("""
+            INSERT INTO employees (employee_id, employee_name)
+            SELECT employee_id, employee_name FROM employees_stage WHERE true
+            ON CONFLICT(employee_id) DO UPDATE SET employee_name = excluded.employee_name
+            WHERE employee_name IS NOT excluded.employee_name
+        """)
+        conn.execute("DELETE FROM employees_stage")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+
+# === মেইন ফাংশন ===
+def main():
+    print("কাউন্টার, রোলআপ ও সার্চ ইনডেক্স নতুন করে তৈরি হচ্ছে...\n")
+    print(f"তারিখ: {datetime.now().strftime('%d %B %Y, %I:%M %p')}\n")
+    conn = sqlite3.connect(DB_NAME, timeout=30)
+    upgrade(conn)
+    rebuild_counters(conn)
+    rebuild_rollups(conn)
+    rebuild_search(conn)
+    employees, buyers, sold = conn.execute("SELECT employees, buyers, sold FROM counters WHERE id = 1").fetchone()
+    sellers = conn.execute("SELECT COUNT(*) FROM seller_totals").fetchone()[0]
+    hours = conn.execute("SELECT COUNT(*) FROM hourly_totals").fetchone()[0]
+    conn.close()
+    print(f"কাউন্টার → কর্মী: {employees}, ক্রেতা: {buyers}, বিক্রি: {sold}")
+    print(f"রোলআপ → বিক্রেতা: {sellers}, ঘণ্টা×বিক্রেতা: {hours}")
+    print("\nসফলভাবে সম্পন্ন!")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"অপ্রত্যাশিত সমস্যা: {e}")
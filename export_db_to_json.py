@@ -3,6 +3,7 @@ import sqlite3
 import json
 from datetime import datetime
 import os
+import db_schema
 
 # ==================== CONFIG ====================
 DB_FILE = "ticket_distribution.db"   # আপনার DB ফাইলের নাম
@@ -27,9 +28,8 @@ except Exception as e:
     print(f"Error: {e}")
     exit()
 
-# সব টেবিলের নাম বের করি
-cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
-tables = [row[0] for row in cur.fetchall()]
+# সব টেবিলের নাম বের করি (sales_fts সার্চ ইনডেক্স ও তার shadow টেবিল বাদ — ওগুলো sales থেকে আবার তৈরি হয়)
+tables = db_schema.data_tables(conn)
 
 print(f"Found tables: {tables}")
 
@@ -0,0 +1,156 @@
+# mongo_client.py
+# MongoDB ক্লায়েন্ট ফ্যাক্টরি (app_mongo.py ও mongo_ok.py)
+# • প্রতি প্রসেসে একটাই MongoClient — অ্যাপ st.cache_resource দিয়ে রাখে
+# • পুল সাইজ, টাইমআউট ও retryable writes এখানে ঠিক করা
+# • রিপোর্টের কুয়েরি secondaryPreferred দিয়ে পড়ে (বুথের লেখা/পড়া primary-তে)
+# • run_transaction(): লেখাগুলো এক ট্রানজেকশনে (replica set / Atlas-এ)
+# • ensure_indexes(): দরকারি ইনডেক্স তৈরি করে (বারবার চালালেও সমস্যা নেই)
+# • সরাসরি চালালে (MONGO_URI=... python mongo_client.py) ইনডেক্স তৈরি করে explain() সারাংশ দেখায়
+
+import atexit
+import os
+
+import pymongo
+from pymongo import ASCENDING, DESCENDING, ReadPreference
+from pymongo.errors import OperationFailure
+
+# === কনফিগারেশন ===
+DB_NAME = "ticketdb"
+
+CLIENT_OPTIONS = {
+    "maxPoolSize": 50,                  # সব সেশন মিলিয়ে একটাই পুল
+    "minPoolSize": 0,
+    "maxIdleTimeMS": 5 * 60 * 1000,     # idle কানেকশন ৫ মিনিট পর বন্ধ
+    "serverSelectionTimeoutMS": 5000,   # ক্লাস্টার না পেলে ৫s-এ এরর, অনির্দিষ্ট অপেক্ষা নয়
+    "connectTimeoutMS": 5000,
+    "socketTimeoutMS": 20000,
+    "retryWrites": True,
+    "retryReads": True,
+    "appname": "ticket-distribution",
+}
+
+REPORT_READ_PREFERENCE = ReadPreference.SECONDARY_PREFERRED
+
+def make_client(uri, **overrides):
+    """টিউন করা MongoClient; প্রসেস বন্ধ হলে কানেকশন বন্ধ করে"""
+    client = pymongo.MongoClient(uri, **{**CLIENT_OPTIONS, **overrides})
+    atexit.register(client.close)
+    return client
+
+def for_reports(collection):
+    """একই কালেকশন, তবে রিপোর্টের জন্য secondaryPreferred রিড"""
+    return collection.with_options(read_preference=REPORT_READ_PREFERENCE)
+
+# === ট্রানজেকশন ===
+ILLEGAL_OPERATION = 20      # standalone mongod: "Transaction numbers are only allowed on a replica set member or mongos"
+
+def run_transaction(client, fn):
+    """fn(session) এক ট্রানজেকশনে চালায় (transient এররে pymongo নিজেই আবার চেষ্টা করে)।
+    ট্রানজেকশন নেই এমন standalone সার্ভারে fn(None) — অর্থাৎ সেশন ছাড়া"""
+    with client.start_session() as session:
+        try:
+            return session.with_transaction(fn)
+        except OperationFailure as e:
+            # Raised by the first write, before anything was applied.
+            if e.code != ILLEGAL_OPERATION or "Transaction numbers" not in str(e):
+                raise
+    return fn(None)
+
+# === ইনডেক্স ===
+# collection → [(keys, options)]. create_index is a no-op when an identical
+# index already exists, so this is safe to run on every process start.
+INDEXES = {
+    "employees": [([("employee_id", ASCENDING)], {"unique": True})],
+    "tickets": [
+        ([("employee_id", ASCENDING)], {"unique": True}),
+        ([("updated_at", ASCENDING)], {}),
+    ],
+    "admins": [([("username", ASCENDING)], {"unique": True})],
+    "sales": [
+        ([("employee_id", ASCENDING), ("_id", DESCENDING)], {}),
+        ([("seller", ASCENDING), ("_id", DESCENDING)], {}),        # log filtered by seller, newest first
+        ([("seller", ASCENDING), ("quantity", ASCENDING)], {}),
+    ],
+    "buyers_view": [([("total", DESCENDING)], {})],
+}
+
+# Indexes the app can't run safely without: the booth's sale path counts on
+# one tickets document per employee. If one of these can't be built (say,
+# duplicates left by the old non-atomic add_sale) startup stops instead.
+REQUIRED_INDEXES = {("tickets", (("employee_id", ASCENDING),))}
+
+def ensure_indexes(db):
+    """সব ইনডেক্স তৈরি করে। ফেরত দেয়: (তৈরি হওয়া নাম, [(কালেকশন, সমস্যা)])।
+    জরুরি ইনডেক্স তৈরি না হলে RuntimeError"""
+    created, failed = [], []
+    for coll, specs in INDEXES.items():
+        for keys, options in specs:
+            try:
+                created.append(f"{coll}.{db[coll].create_index(keys, **options)}")
+            except OperationFailure as e:      # e.g. duplicate employee_id rows block a unique index
+                if (coll, tuple(keys)) in REQUIRED_INDEXES:
+                    raise RuntimeError(f"Required index on {coll} {keys} could not be built "
+                                       f"(remove the duplicate documents first): {e}") from e
+                failed.append((coll, str(e)))
+    return created, failed
+
+def _plan_stages(plan):
+    """winningPlan → স্টেজের তালিকা, যেমন ["FETCH", "IXSCAN(employee_id_1)"]"""
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        stages.append(f"{stage}({plan['indexName']})" if "indexName" in plan else stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return stages
+
+def explain_summary(cursor):
+    """একটি find কার্সরের explain() থেকে প্ল্যান, কতগুলো ডকুমেন্ট দেখা হয়েছে ও ফেরত এসেছে"""
+    info = cursor.explain()
+    planner = info.get("queryPlanner", {})
+    plan = planner.get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)      # slot-based engine nests the plan one level down
+    stats = info.get("executionStats", {})
+    return {
+        "plan": " ← ".join(_plan_stages(plan)),
+        "examined": stats.get("totalDocsExamined"),
+        "keys": stats.get("totalKeysExamined"),
+        "returned": stats.get("nReturned"),
+    }
+
+def sample_queries(db):
+    """অ্যাপের প্রধান কুয়েরিগুলো (explain করার জন্য)"""
+    emp = db.employees.find_one({}, {"employee_id": 1}) or {"employee_id": ""}
+    sale = db.sales.find_one({}, {"seller": 1}) or {"seller": ""}
+    return {
+        "employees by employee_id": db.employees.find({"employee_id": emp["employee_id"]}),
+        "tickets by employee_id": db.tickets.find({"employee_id": emp["employee_id"]}),
+        "admins by username": db.admins.find({"username": "admin"}),
+        "sales of one employee": db.sales.find({"employee_id": emp["employee_id"]}).sort("_id", -1),
+        "sales log of one seller": db.sales.find({"seller": sale.get("seller")}).sort("_id", -1).limit(50),
+        "sales by seller": db.sales.find({"seller": sale.get("seller")}, {"_id": 0, "seller": 1, "quantity": 1}),
+    }
+
+# === মেইন ফাংশন ===
+def main():
+    uri = os.environ.get("MONGO_URI")
+    if not uri:
+        print("সমস্যা: MONGO_URI এনভায়রনমেন্ট ভ্যারিয়েবল দিন।")
+        return
+    db = make_client(uri)[DB_NAME]
+    print("ইনডেক্স তৈরি হচ্ছে...\n")
+    created, failed = ensure_indexes(db)
+    for name in created:
+        print(f"  ✓ {name}")
+    for coll, error in failed:
+        print(f"  ✗ {coll}: {error}")
+
+    print("\nexplain() সারাংশ:")
+    for label, cursor in sample_queries(db).items():
+        r = explain_summary(cursor)
+        print(f"  {label:<28} {r['plan']:<40} keys: {r['keys']}, docs: {r['examined']}, returned: {r['returned']}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nবন্ধ করা হয়েছে।")
@@ -1,11 +1,11 @@
 # app.py → FINAL 100% WORKING VERSION (MongoDB + Streamlit Cloud)
 import streamlit as st
 import pandas as pd
-import pymongo
 from datetime import datetime, timedelta
 import hashlib
 import io
 import time
+import mongo_client
 
 # ==================== CONFIG ====================
 st.set_page_config(page_title="টিকেট বিতরণ", layout="centered")
@@ -14,8 +14,23 @@ TOTAL_TICKETS = 20000
 SESSION_TIMEOUT = timedelta(hours=2)
 
 # ==================== MONGO CONNECTION ====================
-client = pymongo.MongoClient(st.secrets["MONGO_URI"])
-db = client.ticketdb
+# One client per process: reruns reuse its pool instead of reconnecting.
+@st.cache_resource
+def get_client():
+    return mongo_client.make_client(st.secrets["MONGO_URI"])
+
+client = get_client()
+db = client[mongo_client.DB_NAME]
+
+# Indexes are created once per process; `python mongo_client.py` shows the query plans.
+@st.cache_resource
+def provision_indexes():
+    created, failed = mongo_client.ensure_indexes(db)
+    print(f"Mongo indexes ready: {', '.join(created)}")
+    for coll, error in failed:
+        print(f"Mongo index on {coll} not created: {error}")
+
+provision_indexes()
 employees = db.employees
 admins = db.admins
 tickets = db.tickets
@@ -0,0 +1,176 @@
+# report_export.py
+# রিপোর্ট এক্সপোর্ট ইঞ্জিন (ক্রেতা / বিক্রেতা / কেনেনি / লগ)
+# • ডাটাবেস কার্সর থেকে সরাসরি সারি স্ট্রিম করে — পুরো টেবিল মেমোরিতে আনে না
+# • Excel: openpyxl write-only মোড, ফাইল ডিস্কের temp ফাইলে লেখা হয়
+# • CSV / NDJSON (gzip) ও Parquet: বাইট চাংক দেওয়া জেনারেটর (Parquet-এর জন্য pyarrow লাগবে)
+# app.py এটা ব্যবহার করে
+
+import csv
+import io
+import json
+import tempfile
+import time
+import zlib
+
+from openpyxl import Workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # Parquet export is optional
+    pa = pq = None
+
+import db_schema
+
+EXPORT_CHUNK_ROWS = 5000
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+GZIP_LEVEL = 6
+
+# === রিপোর্ট ===
+# name → (default sheet title, headers, SQL). The log query takes an optional
+# WHERE clause built by log_where() so filtered downloads stream the same way.
+REPORTS = {
+    "buyers": ("Buyers", ["Employee Name", "Employee ID", "Total Tickets"], """
+        SELECT e.employee_name, t.employee_id, t.total_quantity
+        FROM tickets t JOIN employees e ON t.employee_id = e.employee_id ORDER BY t.total_quantity DESC"""),
+    "sellers": ("Sellers", ["Seller", "Tickets Sold"], """
+        SELECT seller, tickets FROM seller_totals ORDER BY tickets DESC"""),
+    "nonbuyers": ("Non-buyers", ["Employee ID", "Employee Name"], """
+        SELECT e.employee_id, e.employee_name FROM employees e
+        WHERE NOT EXISTS (SELECT 1 FROM tickets t WHERE t.employee_id = e.employee_id)
+        ORDER BY e.employee_id"""),
+    "log": ("Log", ["Date & Time", "Employee", "Employee ID", "Quantity", "Seller", "Remark"], """
+        SELECT format_ts(ts), employee_name, employee_id, quantity, seller, remark
+        FROM sales{where} ORDER BY id DESC"""),
+}
+
+def log_where(filters, before_id=None):
+    """লগ ফিল্টার → (WHERE ক্লজ, প্যারামিটার)"""
+    where, params = [], []
+    if filters.get("seller"):
+        where.append("seller = ?"); params.append(filters["seller"])
+    if filters.get("emp_id"):
+        where.append("employee_id = ?"); params.append(filters["emp_id"])
+    if filters.get("start_ts") is not None:
+        where.append("ts >= ?"); params.append(filters["start_ts"])
+    if filters.get("end_ts") is not None:
+        where.append("ts < ?"); params.append(filters["end_ts"])
+    if before_id is not None:
+        where.append("id < ?"); params.append(before_id)
+    return (" WHERE " + " AND ".join(where) if where else ""), params
+
+def sheet(name, filters=None, title=None):
+    """একটি শিটের বিবরণ: (title, headers, sql, params)"""
+    default_title, headers, sql = REPORTS[name]
+    where, params = log_where(filters or {}) if name == "log" else ("", [])
+    return title or default_title, headers, sql.format(where=where), params
+
+def stream_rows(conn, sql, params=(), chunk_rows=EXPORT_CHUNK_ROWS):
+    """কার্সর থেকে chunk_rows করে সারি দেয়"""
+    conn.create_function("format_ts", 1, db_schema.format_ts, deterministic=True)
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            break
+        yield rows
+
+# === Excel ===
+def write_xlsx(conn, sheets, out=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """শিটগুলো write-only xlsx-এ স্ট্রিম করে।
+    ফেরত দেয়: (ফাইল — শুরুতে seek করা, {"rows", "seconds", "rows_per_sec"})"""
+    out = out if out is not None else tempfile.TemporaryFile()
+    started = time.perf_counter()
+    total = 0
+    wb = Workbook(write_only=True)
+    for title, headers, sql, params in sheets:
+        ws = wb.create_sheet(title)
+        ws.append(headers)
+        for rows in stream_rows(conn, sql, params, chunk_rows):
+            for row in rows:
+                ws.append(row)
+            total += len(rows)
+    wb.save(out)
+    out.seek(0)
+    seconds = time.perf_counter() - started
+    return out, {"rows": total, "seconds": seconds, "rows_per_sec": total / seconds if seconds else 0.0}
+
+# === CSV / NDJSON / Parquet ===
+# Each iter_* takes one sheet from sheet() and yields the file as byte chunks,
+# one database batch at a time. Column names are the same headers Excel uses.
+def _gzip(chunks):
+    gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)    # wbits 31 → gzip container
+    for chunk in chunks:
+        data = gz.compress(chunk)
+        if data:
+            yield data
+    yield gz.flush()
+
+def _csv_chunks(conn, sheet, chunk_rows):
+    _, headers, sql, params = sheet
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    buf.write("\ufeff")       # BOM so Excel opens the Bengali text as UTF-8
+    writer.writerow(headers)
+    for rows in stream_rows(conn, sql, params, chunk_rows):
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+def _ndjson_chunks(conn, sheet, chunk_rows):
+    _, headers, sql, params = sheet
+    for rows in stream_rows(conn, sql, params, chunk_rows):
+        yield "".join(json.dumps(dict(zip(headers, row)), ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+
+def iter_csv_gz(conn, sheet, chunk_rows=EXPORT_CHUNK_ROWS):
+    """gzip CSV"""
+    return _gzip(_csv_chunks(conn, sheet, chunk_rows))
+
+def iter_ndjson_gz(conn, sheet, chunk_rows=EXPORT_CHUNK_ROWS):
+    """gzip NDJSON — প্রতি লাইনে একটি JSON অবজেক্ট"""
+    return _gzip(_ndjson_chunks(conn, sheet, chunk_rows))
+
+def _arrow_type(values):
+    for v in values:
+        if isinstance(v, bool) or v is None:
+            continue
+        if isinstance(v, int):
+            return pa.int64()
+        if isinstance(v, float):
+            return pa.float64()
+        return pa.string()
+    return pa.string()
+
+def iter_parquet(conn, sheet, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Parquet — প্রতিটি ব্যাচ একটি row group (pyarrow লাগবে)"""
+    if pa is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    _, headers, sql, params = sheet
+    with tempfile.TemporaryFile() as out:
+        writer = None
+        for rows in stream_rows(conn, sql, params, chunk_rows):
+            columns = list(zip(*rows))
+            if writer is None:
+                schema = pa.schema([(h, _arrow_type(col)) for h, col in zip(headers, columns)])
+                writer = pq.ParquetWriter(out, schema)
+            writer.write_table(pa.table([pa.array(col, t) for col, t in zip(columns, schema.types)], schema=schema))
+        if writer is None:
+            writer = pq.ParquetWriter(out, pa.schema([(h, pa.string()) for h in headers]))
+        writer.close()
+        out.seek(0)
+        while True:
+            data = out.read(1024 * 1024)
+            if not data:
+                break
+            yield data
+
+# format → (label, extension, mime, iter_*)
+FORMATS = {
+    "csv": ("CSV (gzip)", "csv.gz", "application/gzip", iter_csv_gz),
+    "ndjson": ("NDJSON (gzip)", "ndjson.gz", "application/gzip", iter_ndjson_gz),
+}
+if pa is not None:
+    FORMATS["parquet"] = ("Parquet", "parquet", "application/vnd.apache.parquet", iter_parquet)